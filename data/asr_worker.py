@@ -0,0 +1,271 @@
+import os
+import subprocess
+import sys
+import threading
+import traceback
+import typing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+import numpy as np
+import shared
+
+# Hosts a SimpleASRModel in its own process, so decoding doesn't hold the GIL of the
+# process running the keyboard hook and the UI. Audio goes through shared memory, everything
+# else is pickled over a local socket. Started as a script rather than with multiprocessing,
+# since spawning would re-import stt.py in the child.
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+CONNECT_TIMEOUT = 60.0
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # type: ignore
+    except TypeError:
+        # Before 3.13 attaching also registers the block for cleanup, which would unlink
+        # it from under the parent when this process exits.
+        block = shared_memory.SharedMemory(name=name)
+        if os.name != "nt":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(block._name, "shared_memory") # type: ignore
+        return block
+
+class ASRWorkerProcess(shared.SimpleASRModel):
+    # Parent side. Looks like any other model to stt.py.
+    def __init__(self, chosen_model: str, state: shared.ModelLoadingState):
+        super().__init__(state)
+        self._lock = threading.Lock()
+        self._block: shared_memory.SharedMemory | None = None
+        authkey = os.urandom(32)
+        listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        state.settext("Starting the ASR worker process...")
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE)
+        stdin = typing.cast(typing.IO[bytes], self.process.stdin)
+        stdin.write(f"{listener.address[1]}\n{authkey.hex()}\n".encode())
+        stdin.close()
+        self.connection = self._accept(listener)
+        state.checkpoints.checkpoint("starting worker process")
+        self.connection.send(("load", chosen_model, {
+            "model_dir": state.model_dir,
+            "prompt": state.prompt,
+            "model_keywords": state.model_keywords,
+            "allow_cpu": state.allow_cpu,
+            "model_options": state.model_options,
+            "cpu_int8": state.cpu_int8,
+        }))
+        while True:
+            message = self._receive()
+            kind = message[0]
+            if kind == "loaded":
+                self._sample_rate, self._supports_prompting, self._default_prompt = message[1:]
+                break
+            elif kind == "status":
+                state.settext(message[1])
+            elif kind == "spinner":
+                if message[1]:
+                    state.show_spinner()
+                else:
+                    state.hide_spinner()
+            elif kind == "ask":
+                self.connection.send(("answer", state.ask_allow_or_deny(message[1])))
+            elif kind == "cpu_warning":
+                state.show_cpu_warning()
+            elif kind == "cancel":
+                state.cancel_init(message[1])
+                self.close()
+                raise shared.ModelInitCancelledError()
+            elif kind == "quit":
+                self.close()
+                state.quit()
+                raise shared.ModelInitCancelledError()
+        state.checkpoints.checkpoint("loading model in worker process")
+
+    def _accept(self, listener: Listener) -> Connection:
+        accepted: list[Connection] = []
+        done = threading.Event()
+        def worker():
+            try:
+                accepted.append(listener.accept())
+            except OSError:
+                pass
+            finally:
+                done.set()
+        threading.Thread(target=worker, daemon=True).start()
+        timer = shared.Timer()
+        while not done.wait(0.25):
+            if self.process.poll() is not None or timer.time() > CONNECT_TIMEOUT:
+                listener.close()
+                self.process.kill()
+                raise RuntimeError(f"The ASR worker process didn't connect (exit code {self.process.poll()}).")
+        listener.close()
+        if len(accepted) == 0:
+            raise RuntimeError("The ASR worker process didn't connect.")
+        return accepted[0]
+
+    def _receive(self) -> tuple:
+        try:
+            message = self.connection.recv()
+        except EOFError:
+            raise RuntimeError(f"The ASR worker process exited unexpectedly (exit code {self.process.poll()}).")
+        if message[0] == "error":
+            raise RuntimeError(f"Error in the ASR worker process: {message[1]}")
+        return message
+
+    def _request(self, *message) -> tuple:
+        with self._lock:
+            self.connection.send(message)
+            return self._receive()
+
+    @property
+    def sample_rate(self) -> int:
+        return self._sample_rate
+
+    def transcribe(self, file: str) -> str:
+        return self._request("transcribe_file", file)[1]
+
+    def transcribe_array(self, samples: np.ndarray, sample_rate: int) -> str:
+        return self.transcribe_batch([samples], sample_rate)[0]
+
+    def transcribe_batch(self, samples_list: list[np.ndarray], sample_rate: int) -> list[str]:
+        with self._lock:
+            total = sum(len(samples) for samples in samples_list)
+            size = max(1, total) * np.dtype(np.float32).itemsize
+            if self._block is None or self._block.size < size:
+                if self._block is not None:
+                    self._block.close()
+                    self._block.unlink()
+                # Leave room to grow so the worker rarely has to attach to a new block.
+                self._block = shared_memory.SharedMemory(create=True, size=size * 2)
+            staging = np.ndarray((total,), dtype=np.float32, buffer=self._block.buf)
+            spans: list[tuple[int, int]] = []
+            offset = 0
+            for samples in samples_list:
+                staging[offset:offset + len(samples)] = samples
+                spans.append((offset, len(samples)))
+                offset += len(samples)
+            del staging
+            self.connection.send(("transcribe", self._block.name, spans, sample_rate))
+            return self._receive()[1]
+
+    def supports_prompting(self) -> bool:
+        return self._supports_prompting
+
+    def default_prompt(self) -> str:
+        if self._default_prompt is None:
+            raise NotImplementedError()
+        return self._default_prompt
+
+    def set_prompt(self, prompt: str):
+        self._request("set_prompt", prompt)
+
+    def close(self):
+        try:
+            self.connection.send(("close",))
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+class WorkerLoadingState(shared.ModelLoadingState):
+    # Child side. Anything that would touch the UI is forwarded to the parent.
+    def __init__(self, connection: Connection, options: dict[str, typing.Any]):
+        self.connection = connection
+        def quit():
+            connection.send(("quit",))
+            raise shared.ModelInitCancelledError()
+        super().__init__(
+            window=None, # type: ignore
+            settext=lambda text: connection.send(("status", text)),
+            quit=quit,
+            cancel_init=lambda reason: connection.send(("cancel", reason)),
+            show_spinner=lambda: connection.send(("spinner", True)),
+            hide_spinner=lambda: connection.send(("spinner", False)),
+            model_dir=options["model_dir"],
+            prompt=options["prompt"],
+            model_keywords=options["model_keywords"],
+            allow_cpu=options["allow_cpu"],
+            model_options=options["model_options"],
+            cpu_int8=options["cpu_int8"]
+            )
+
+    def ask_allow_or_deny(self, text: str) -> bool:
+        self.connection.send(("ask", text))
+        return self.connection.recv()[1]
+
+    def show_cpu_warning(self):
+        self.connection.send(("cpu_warning",))
+
+    def load_and_check_torch(self):
+        # The CUDA download prompt needs the UI, so the worker only warns.
+        allow_cpu = self.allow_cpu
+        self.allow_cpu = True
+        super().load_and_check_torch()
+        self.allow_cpu = allow_cpu
+        import torch
+        if not torch.cuda.is_available() and not allow_cpu:
+            self.show_cpu_warning()
+
+def serve(connection: Connection):
+    model: shared.SimpleASRModel | None = None
+    block: shared_memory.SharedMemory | None = None
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        kind = message[0]
+        if kind == "close":
+            break
+        try:
+            if kind == "load":
+                state = WorkerLoadingState(connection, message[2])
+                try:
+                    model = shared.load_asr_model(message[1], state)
+                except shared.ModelInitCancelledError:
+                    break
+                state.checkpoints.end()
+                state.checkpoints.print()
+                default_prompt = model.default_prompt() if model.supports_prompting() else None
+                connection.send(("loaded", model.sample_rate, model.supports_prompting(), default_prompt))
+                continue
+            if model is None:
+                raise RuntimeError(f"Got \"{kind}\" before the model was loaded.")
+            if kind == "transcribe":
+                name, spans, sample_rate = message[1:]
+                if block is None or block.name != name:
+                    if block is not None:
+                        block.close()
+                    block = _attach(name)
+                total = sum(length for _, length in spans)
+                data = np.ndarray((total,), dtype=np.float32, buffer=block.buf)
+                texts = model.transcribe_batch([data[offset:offset + length] for offset, length in spans], sample_rate)
+                del data
+                connection.send(("result", [str(text) for text in texts]))
+            elif kind == "transcribe_file":
+                connection.send(("result", str(model.transcribe(message[1]))))
+            elif kind == "set_prompt":
+                model.set_prompt(message[1])
+                connection.send(("ok",))
+            else:
+                raise RuntimeError(f"Unknown request \"{kind}\".")
+        except Exception as e:
+            traceback.print_exc()
+            connection.send(("error", f"({type(e).__name__}) {e}"))
+    if block is not None:
+        block.close()
+
+def main():
+    port = int(sys.stdin.readline())
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    connection = Client(("127.0.0.1", port), authkey=authkey)
+    print(f"ASR worker process {os.getpid()} connected.")
+    serve(connection)
+    connection.close()
+
+if __name__ == "__main__":
+    main()
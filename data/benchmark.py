@@ -0,0 +1,202 @@
+import argparse
+import importlib.util
+import inspect
+import os
+import sys
+import time
+import typing
+import numpy as np
+import shared
+import capture
+import preprocessing
+
+# Headless latency benchmark. Replays WAV files through the same capture buffer, audio
+# pipeline, ASR model and filter scripts that stt.py uses, without a microphone or window.
+# Run from the STT folder, e.g.
+#   python data/benchmark.py recordings/ --model none --speed 0 --filters filters/excited.py
+
+def _noop(*args, **kwargs):
+    pass
+
+def headless_model_state(model_dir: str, prompt: str, cpu_int8: bool = False) -> shared.ModelLoadingState:
+    return shared.ModelLoadingState(
+        window=None, # type: ignore
+        settext=print,
+        quit=sys.exit,
+        cancel_init=print,
+        show_spinner=_noop,
+        hide_spinner=_noop,
+        model_dir=model_dir,
+        prompt=prompt,
+        model_keywords=[],
+        allow_cpu=True,
+        cpu_int8=cpu_int8
+        )
+
+class FilterScript:
+    def __init__(self, filename: str):
+        self.name = os.path.splitext(os.path.basename(filename))[0]
+        spec = importlib.util.spec_from_file_location(self.name, filename)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"Could not load spec for {filename}")
+        self.module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = self.module
+        spec.loader.exec_module(self.module)
+        if not hasattr(self.module, "process"):
+            raise ImportError(f"Plugin {filename} does not have a process() function.")
+        self.supports_args = "args" in inspect.signature(self.module.process).parameters
+        self.args: dict[str, typing.Any] = {"invoker": self.name}
+
+    def load(self):
+        if not hasattr(self.module, "on_load"):
+            return
+        self.module.on_load(shared.PluginLoadingState(
+            window=None, # type: ignore
+            settext=print,
+            quit=sys.exit,
+            cancel_init=print,
+            show_spinner=_noop,
+            hide_spinner=_noop,
+            filter_name=self.name,
+            action_options=None
+            ))
+
+    def process(self, input: str) -> str:
+        if self.supports_args:
+            return self.module.process(input, self.args)
+        return self.module.process(input)
+
+class Measurements:
+    def __init__(self):
+        self.values: dict[str, list[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        self.values.setdefault(name, []).append(seconds)
+
+    def print_summary(self):
+        print("Summary (ms)       mean      p50      p95      max")
+        for name, values in self.values.items():
+            ms = np.array(values) * 1000
+            print(f"  {name:<14} {ms.mean():8.1f} {np.percentile(ms, 50):8.1f} {np.percentile(ms, 95):8.1f} {ms.max():8.1f}")
+
+class Utterance:
+    def __init__(self, filename: str, audio_length: float, samples: np.ndarray):
+        self.filename = filename
+        self.audio_length = audio_length
+        self.samples = samples
+        self.timings = ""
+
+def capture_utterance(source: capture.ReplaySource, buffer: capture.CaptureBuffer, pipeline: preprocessing.AudioPipeline, measurements: Measurements) -> Utterance:
+    buffer.reset()
+    start = time.perf_counter()
+    source.begin(buffer)
+    filename = source.current_file or ""
+    source.wait()
+    source.finish()
+    captured = time.perf_counter()
+    # Copy, the buffer is reused for the next file of the batch.
+    samples = pipeline.process(buffer.view().copy())
+    prepared = time.perf_counter()
+    measurements.add("audio", buffer.cursor / source.rate)
+    measurements.add("capture", captured - start)
+    measurements.add("preprocess", prepared - captured)
+    utterance = Utterance(filename, buffer.cursor / source.rate, samples)
+    utterance.timings = f"capture {(captured - start) * 1000:.1f}ms, preprocess {(prepared - captured) * 1000:.1f}ms ({pipeline.timings()})"
+    return utterance
+
+def run(source: capture.ReplaySource, buffer: capture.CaptureBuffer, pipeline: preprocessing.AudioPipeline, model: shared.SimpleASRModel, filters: list[FilterScript], batch_size: int, measurements: Measurements):
+    utterances = [capture_utterance(source, buffer, pipeline, measurements) for _ in range(batch_size)]
+    start = time.perf_counter()
+    if batch_size == 1:
+        texts = [model.transcribe_array(utterances[0].samples, model.sample_rate)]
+    else:
+        texts = model.transcribe_batch([utterance.samples for utterance in utterances], model.sample_rate)
+    transcribed = time.perf_counter()
+    # Batched ASR time is shared evenly between the utterances in the batch.
+    asr_time = (transcribed - start) / batch_size
+    for utterance, text in zip(utterances, texts):
+        text = str(text).strip()
+        filter_start = time.perf_counter()
+        for script in filters:
+            text = script.process(text)
+        filter_time = time.perf_counter() - filter_start
+        measurements.add("asr", asr_time)
+        measurements.add("filters", filter_time)
+        print(f"{os.path.basename(utterance.filename)}: {utterance.audio_length * 1000:.0f}ms audio, {utterance.timings}, "
+              f"asr {asr_time * 1000:.1f}ms, filters {filter_time * 1000:.1f}ms -> \"{text}\"")
+
+def compare_parakeet_paths(model: shared.SimpleASRModel, clips: list[tuple[str, np.ndarray]], repeat: int):
+    # Times ParakeetV2's direct inference path against NeMo's transcribe() on the same clips.
+    from models.parakeetv2 import ParakeetV2
+    if not isinstance(model, ParakeetV2):
+        raise RuntimeError("--compare-parakeet needs --model parakeet.")
+    measurements = Measurements()
+    for filename, samples in clips:
+        audio = [np.ascontiguousarray(samples, dtype=np.float32)]
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            nemo_text = model._decode_nemo(audio)[0]
+            middle = time.perf_counter()
+            direct_text = model._decode_direct(audio)[0]
+            end = time.perf_counter()
+            measurements.add("transcribe()", middle - start)
+            measurements.add("direct", end - middle)
+        match = "same text" if nemo_text.strip() == direct_text.strip() else f"text differs: \"{nemo_text}\" / \"{direct_text}\""
+        print(f"{os.path.basename(filename)}: {len(samples) / model.sample_rate * 1000:.0f}ms audio, "
+              f"transcribe() {(middle - start) * 1000:.1f}ms, direct {(end - middle) * 1000:.1f}ms, {match}")
+    measurements.print_summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WAV files through the STT audio pipeline, ASR model and filters, and time each step.")
+    parser.add_argument("audio", help="A .wav file or a directory of them.")
+    parser.add_argument("--model", default="none", help="\"none\" (FakeASRModel), \"parakeet\", \"parakeet_onnx\", \"granite\", or the path to a .py file with an ASRModel.")
+    parser.add_argument("--model-dir", default="models/", help="Same as path_to_model in the config.")
+    parser.add_argument("--prompt", default="", help="Prompt for models that support prompting.")
+    parser.add_argument("--cpu-int8", action="store_true", help="Same as cpu_int8_quantization in the config.")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed as a multiple of real time. 0 replays as fast as possible.")
+    parser.add_argument("--repeat", type=int, default=1, help="How many times to play every file.")
+    parser.add_argument("--warmup", type=int, default=1, help="Warm-up passes to run before timing, like warmup_passes in the config.")
+    parser.add_argument("--batch", type=int, default=1, help="Transcribe this many files at a time with transcribe_batch().")
+    parser.add_argument("--pipeline", default="trim,pad,clip", help="Comma separated audio_pipeline stages.")
+    parser.add_argument("--minimum-length", type=float, default=500, help="Same as minimum_utterance_audio_length in the config, in milliseconds.")
+    parser.add_argument("--compare-parakeet", action="store_true", help="Compare ParakeetV2's direct inference path with NeMo's transcribe() instead of running the pipeline.")
+    parser.add_argument("--filters", nargs="*", default=[], help="Filter scripts to run on each transcription, in order.")
+    options = parser.parse_args()
+
+    files = capture.replay_files(options.audio)
+    load_timer = shared.Timer()
+    state = headless_model_state(options.model_dir, options.prompt, options.cpu_int8)
+    model = shared.load_asr_model(options.model, state)
+    rate = model.sample_rate
+    pipeline = preprocessing.AudioPipeline.build([name.strip() for name in options.pipeline.split(",") if name.strip()], rate, {
+        "model_rate": rate,
+        "minimum_length": options.minimum_length / 1000,
+    })
+    shared.warm_up_model(model, pipeline.process, rate, options.warmup, state.checkpoints)
+    state.checkpoints.end()
+    state.checkpoints.print()
+    print(f"Loaded model in {load_timer.resetmstrnc()}ms")
+    if options.compare_parakeet:
+        decoder = capture.ReplaySource(files, rate, 256)
+        compare_parakeet_paths(model, [(filename, pipeline.process(decoder.load(filename).copy())) for filename in files], options.repeat)
+        return
+    filters = [FilterScript(filename) for filename in options.filters]
+    for script in filters:
+        script.load()
+    print(f"Loaded {len(filters)} filter(s) in {load_timer.resetmstrnc()}ms")
+
+    source = capture.ReplaySource(files, rate, max(256, int(rate * 0.032)), speed=options.speed)
+    for filename in files:
+        source.load(filename)
+    longest = max(len(source.load(filename)) for filename in files)
+    buffer = capture.CaptureBuffer(max_samples=longest, initial_samples=longest)
+    measurements = Measurements()
+    batch_size = max(1, options.batch)
+    remaining = options.repeat * len(files)
+    while remaining > 0:
+        run(source, buffer, pipeline, model, filters, min(batch_size, remaining), measurements)
+        remaining -= batch_size
+    measurements.print_summary()
+
+if __name__ == "__main__":
+    main()
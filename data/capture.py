@@ -0,0 +1,283 @@
+import numpy as np
+import os
+import threading
+import time
+import typing
+import wave
+
+class CaptureBuffer:
+    def __init__(self, max_samples: int, initial_samples: int, dtype: type = np.float32):
+        if max_samples <= 0:
+            raise RuntimeError(f"CaptureBuffer needs a positive sample cap, got {max_samples}.")
+        self.dtype = np.dtype(dtype)
+        self.max_samples = max_samples
+        self.data = np.empty(max(1, min(initial_samples, max_samples)), dtype=self.dtype)
+        self.cursor = 0
+        self.truncated = False
+
+    def reset(self):
+        self.cursor = 0
+        self.truncated = False
+
+    def is_full(self) -> bool:
+        return self.cursor >= self.max_samples
+
+    def _grow(self, required: int):
+        capacity = len(self.data)
+        while capacity < required:
+            capacity *= 2
+        capacity = min(capacity, self.max_samples)
+        grown = np.empty(capacity, dtype=self.dtype)
+        grown[:self.cursor] = self.data[:self.cursor]
+        self.data = grown
+
+    def write(self, chunk: np.ndarray) -> int:
+        count = len(chunk)
+        remaining = self.max_samples - self.cursor
+        if count > remaining:
+            count = remaining
+            self.truncated = True
+        end = self.cursor + count
+        if end > len(self.data):
+            self._grow(end)
+        self.data[self.cursor:end] = chunk[:count]
+        self.cursor = end
+        return count
+
+    def view(self) -> np.ndarray:
+        # Zero-copy; only valid until the next reset().
+        return self.data[:self.cursor]
+
+class RingBuffer:
+    def __init__(self, capacity: int, dtype: type = np.float32):
+        self.dtype = np.dtype(dtype)
+        self.data = np.zeros(max(1, capacity), dtype=self.dtype)
+        self.cursor = 0
+        self.filled = 0
+
+    def clear(self):
+        self.cursor = 0
+        self.filled = 0
+
+    def write(self, chunk: np.ndarray):
+        capacity = len(self.data)
+        count = len(chunk)
+        if count >= capacity:
+            self.data[:] = chunk[count - capacity:]
+            self.cursor = 0
+            self.filled = capacity
+            return
+        first = min(count, capacity - self.cursor)
+        self.data[self.cursor:self.cursor + first] = chunk[:first]
+        self.data[:count - first] = chunk[first:]
+        self.cursor = (self.cursor + count) % capacity
+        self.filled = min(capacity, self.filled + count)
+
+    def read_into(self, buffer: CaptureBuffer):
+        # Oldest samples first.
+        if self.filled < len(self.data):
+            buffer.write(self.data[:self.filled])
+            return
+        buffer.write(self.data[self.cursor:])
+        buffer.write(self.data[:self.cursor])
+
+def supports_float32(pa: typing.Any, rate: int) -> bool:
+    import pyaudio
+    try:
+        device = pa.get_default_input_device_info()["index"]
+        return bool(pa.is_format_supported(rate, input_device=device, input_channels=1, input_format=pyaudio.paFloat32))
+    except (IOError, ValueError, KeyError):
+        return False
+
+class AudioSource:
+    # Fills a CaptureBuffer between begin() and a stop. Warm sources stay open between
+    # recordings, cold ones are closed by finish().
+    def __init__(self, rate: int, frames_per_buffer: int, buffer: CaptureBuffer | None = None, warm: bool = False):
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.warm = warm
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._stop_requested = False
+        self.buffer: CaptureBuffer | None = buffer
+
+    def begin(self, buffer: CaptureBuffer):
+        with self._lock:
+            self._stop_requested = False
+            self.stopped.clear()
+            self.buffer = buffer
+
+    def buffer_period(self) -> float:
+        return self.frames_per_buffer / self.rate
+
+    def request_stop(self):
+        self._stop_requested = True
+
+    def is_active(self) -> bool:
+        return True
+
+    def wait(self):
+        # The stop request is seen by the next block, one buffer period away at most.
+        while not self.stopped.wait(self.buffer_period() * 4):
+            if not self.is_active():
+                print("Audio source went inactive while recording.")
+                self.stopped.set()
+
+    def finish(self):
+        if not self.warm:
+            self.close()
+            return
+        with self._lock:
+            self.buffer = None
+            self.stopped.set()
+
+    def close(self):
+        self._stop_requested = True
+        with self._lock:
+            self.buffer = None
+
+class MicrophoneCapture(AudioSource):
+    def __init__(self, pa: typing.Any, rate: int, frames_per_buffer: int, buffer: CaptureBuffer | None = None, warm: bool = False, preroll_samples: int = 0, float32: bool = True):
+        # Buffers are always float32. With float32=False the device is opened as int16
+        # and converted in the callback instead.
+        super().__init__(rate, frames_per_buffer, buffer, warm)
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        self._complete = pyaudio.paComplete
+        self.float32 = float32
+        self._scratch = np.empty(frames_per_buffer, dtype=np.float32)
+        self.preroll = RingBuffer(preroll_samples) if warm and preroll_samples > 0 else None
+        self.stream = pa.open(
+            format=pyaudio.paFloat32 if float32 else pyaudio.paInt16,
+            rate=rate,
+            channels=1,
+            input=True,
+            frames_per_buffer=frames_per_buffer,
+            stream_callback=self._callback
+            )
+
+    def _decode(self, in_data: bytes) -> np.ndarray:
+        if self.float32:
+            return np.frombuffer(in_data, dtype=np.float32)
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if len(samples) > len(self._scratch):
+            self._scratch = np.empty(len(samples), dtype=np.float32)
+        converted = self._scratch[:len(samples)]
+        np.multiply(samples, np.float32(1.0 / 32768.0), out=converted)
+        return converted
+
+    def _callback(self, in_data: bytes | None, frame_count: int, time_info: dict, status: int):
+        # Runs on the PortAudio thread. Keep this short, it holds the GIL.
+        with self._lock:
+            target = self.buffer
+            if target is None:
+                if self.preroll is not None and in_data is not None:
+                    self.preroll.write(self._decode(in_data))
+                return (None, self._continue)
+            if in_data is not None:
+                target.write(self._decode(in_data))
+            if self._stop_requested or target.is_full():
+                self.buffer = None
+                self.stopped.set()
+                if not self.warm:
+                    return (None, self._complete)
+        return (None, self._continue)
+
+    def begin(self, buffer: CaptureBuffer):
+        # Starts filling buffer, beginning with whatever is in the pre-roll.
+        with self._lock:
+            self._stop_requested = False
+            self.stopped.clear()
+            if self.preroll is not None:
+                self.preroll.read_into(buffer)
+                self.preroll.clear()
+            self.buffer = buffer
+
+    def is_active(self) -> bool:
+        return self.stream.is_active()
+
+    def close(self):
+        super().close()
+        try:
+            self.stream.stop_stream()
+        finally:
+            self.stream.close()
+
+def replay_files(path: str) -> list[str]:
+    # A single WAV file, or every WAV file in a directory in name order.
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".wav"))
+    elif os.path.isfile(path):
+        files = [path]
+    else:
+        raise RuntimeError(f"Replay audio path \"{path}\" does not exist.")
+    if len(files) == 0:
+        raise RuntimeError(f"No .wav files found in \"{path}\".")
+    return files
+
+PCM_FORMATS: dict[int, tuple[type, float, float]] = {
+    # Sample width in bytes: (dtype, offset, scale to -1..1)
+    1: (np.uint8, 128.0, 1.0 / 128.0),
+    2: (np.int16, 0.0, 1.0 / 32768.0),
+    4: (np.int32, 0.0, 1.0 / 2147483648.0),
+}
+
+class ReplaySource(AudioSource):
+    # Plays WAV files into the buffer one per begin(), cycling through them. speed is a
+    # multiple of real time; 0 or less writes as fast as possible.
+    def __init__(self, files: list[str], rate: int, frames_per_buffer: int, speed: float = 1.0):
+        super().__init__(rate, frames_per_buffer, warm=True)
+        self.files = files
+        self.speed = speed
+        self.next_file = 0
+        self.current_file: str | None = None
+        self._decoded: dict[str, np.ndarray] = {}
+
+    def load(self, filename: str) -> np.ndarray:
+        samples = self._decoded.get(filename)
+        if samples is not None:
+            return samples
+        with wave.open(filename, "rb") as file:
+            file_rate = file.getframerate()
+            channels = file.getnchannels()
+            width = file.getsampwidth()
+            frames = file.readframes(file.getnframes())
+        if width not in PCM_FORMATS:
+            raise RuntimeError(f"Can't replay {filename}: {width * 8}-bit WAV files aren't supported.")
+        dtype, offset, scale = PCM_FORMATS[width]
+        data = np.frombuffer(frames, dtype=dtype).reshape(-1, channels)
+        samples = (data.mean(axis=1, dtype=np.float32) - np.float32(offset)) * np.float32(scale)
+        if file_rate != self.rate:
+            import preprocessing
+            samples = preprocessing.PolyphaseResampler(file_rate, self.rate).process(samples)
+        self._decoded[filename] = samples
+        return samples
+
+    def begin(self, buffer: CaptureBuffer):
+        filename = self.files[self.next_file]
+        self.next_file = (self.next_file + 1) % len(self.files)
+        samples = self.load(filename)
+        self.current_file = filename
+        super().begin(buffer)
+        thread = threading.Thread(target=self._play, args=(samples, buffer), daemon=True)
+        thread.start()
+
+    def _play(self, samples: np.ndarray, buffer: CaptureBuffer):
+        period = self.buffer_period() / self.speed if self.speed > 0 else 0.0
+        deadline = time.perf_counter()
+        for start in range(0, len(samples), self.frames_per_buffer):
+            if period > 0:
+                deadline += period
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            with self._lock:
+                if self.buffer is not buffer:
+                    return
+                buffer.write(samples[start:start + self.frames_per_buffer])
+                if self._stop_requested or buffer.is_full():
+                    break
+        with self._lock:
+            if self.buffer is buffer:
+                self.buffer = None
+                self.stopped.set()
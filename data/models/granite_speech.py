@@ -1,7 +1,39 @@
 import shared
 import os
+import typing
+import numpy as np
 import soundfile as sf
 
+MAX_BATCH_SIZE = 4
+
+def repetition_stopper(prompt_length: int, batch_size: int, repeats: int, end_token_ids: list[int], max_ngram: int = 8, min_span: int = 8) -> typing.Any:
+    # Stops a row once its newest tokens are the same n-gram repeated back to back. cut
+    # records, per row, how many generated tokens to keep: everything up to the first copy.
+    # Rows that already ended are padded by generate(), and those pads aren't a loop.
+    import torch
+    from transformers import StoppingCriteria
+    class RepetitionStopper(StoppingCriteria):
+        def __init__(self):
+            self.cut: list[int | None] = [None] * batch_size
+
+        def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+            generated = input_ids[:, prompt_length:]
+            length = generated.shape[1]
+            done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            ended = torch.isin(generated, torch.tensor(end_token_ids, dtype=torch.long, device=input_ids.device)).any(dim=1)
+            for size in range(1, max_ngram + 1):
+                count = max(repeats, -(-min_span // size))
+                if length < size * count:
+                    continue
+                tail = generated[:, -size * count:].reshape(-1, count, size)
+                looping = (tail == tail[:, :1, :]).all(dim=2).all(dim=1) & ~ended
+                for row in torch.nonzero(looping).flatten().tolist():
+                    if self.cut[row] is None:
+                        self.cut[row] = length - size * (count - 1)
+                done |= looping
+            return typing.cast(torch.BoolTensor, done)
+    return RepetitionStopper()
+
 class GraniteSpeech4p1x2B(shared.SimpleASRModel):
     def __init__(self, state: shared.ModelLoadingState):
         super().__init__(state)
@@ -44,31 +76,51 @@ class GraniteSpeech4p1x2B(shared.SimpleASRModel):
             model_path,
             local_files_only=True,
         )
+        # Batches are padded; generation continues from the right end of every row.
+        self.processor.tokenizer.padding_side = "left"
         state.checkpoints.checkpoint("loading processor")
         state.settext("Loading granite-speech-4.1-2b (M)...")
         print("Loading model...")
-        self.model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            model_path,
-            local_files_only=True,
-            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-        ).to(self.device)
-        state.checkpoints.checkpoint("loading model")
+        def load_model():
+            return AutoModelForSpeechSeq2Seq.from_pretrained(
+                model_path,
+                local_files_only=True,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+            ).to(self.device)
+        if state.cpu_int8 and self.device == "cpu":
+            self.model = shared.load_int8_cpu_model(load_model, model_path, state)
+        else:
+            self.model = load_model()
+            state.checkpoints.checkpoint("loading model")
         self._default_prompt = state.prompt.strip()
         if len(state.model_keywords) > 0:
             self.keywords = "Keywords: " + ", ".join(state.model_keywords)
             self._default_prompt += "\n"
             self._default_prompt += self.keywords
         self.prompt = self._default_prompt
+        self._prompt_cache: tuple[str, list[int] | None, list[int] | None] | None = None
+        # The token budget grows with the audio so a hallucinating decode on a short clip
+        # can't run for long. [meta.model_options] in the config can change these.
+        self.max_tokens_per_second = state.get_option_number("max_tokens_per_second", 10.0)
+        self.min_new_tokens_budget = int(state.get_option_number("min_new_tokens", 16))
+        self.repetition_limit = int(state.get_option_number("repetition_limit", 4))
 
     def transcribe(self, file: str) -> str:
-        import torch
-        wav, sr = sf.read(file) # type: ignore
+        wav, sr = sf.read(file, dtype="float32") # type: ignore
         if len(wav.shape) > 1:
             wav = wav.mean(axis=1)  # stereo -> mono
+        return self.transcribe_array(wav, sr)
+
+    def transcribe_array(self, samples: np.ndarray, sample_rate: int) -> str:
+        return self.transcribe_batch([samples], sample_rate)[0]
 
-        wav = torch.tensor(wav, dtype=torch.float32)
+    def _encoded_prompt(self) -> tuple[str, list[int] | None, list[int] | None]:
+        # The templated prompt and its token ids before and after the audio placeholder.
+        # Only set_prompt() changes these, so they're built once instead of per utterance.
+        if self._prompt_cache is not None:
+            return self._prompt_cache
         tokenizer = self.processor.tokenizer
-        prompt = tokenizer.apply_chat_template(
+        templated = tokenizer.apply_chat_template(
             [
                 {
                     "role": "user",
@@ -78,22 +130,92 @@ class GraniteSpeech4p1x2B(shared.SimpleASRModel):
             tokenize=False,
             add_generation_prompt=True,
         )
-        inputs = self.processor(
-            prompt,
-            wav,
-            return_tensors="pt",
-        ).to(self.device)
-        output = self.model.generate(
-            **inputs,
-            do_sample=False,
-            num_beams=1,
-            max_new_tokens=200,
-        )
-        prompt_len = inputs["input_ids"].shape[-1]
-        return tokenizer.batch_decode(
-            output[:, prompt_len:],
-            skip_special_tokens=True,
-        )[0]
+        prefix = None
+        suffix = None
+        audio_token_id = tokenizer.convert_tokens_to_ids(self.processor.audio_token)
+        ids = list(tokenizer(templated)["input_ids"])
+        if ids.count(audio_token_id) == 1 and hasattr(self.processor, "audio_processor"):
+            split = ids.index(audio_token_id)
+            prefix = ids[:split]
+            suffix = ids[split + 1:]
+        self._prompt_cache = (templated, prefix, suffix)
+        return self._prompt_cache
+
+    def _build_inputs(self, wavs: list, prefix: list[int], suffix: list[int]) -> dict | None:
+        # Same tensors the processor builds, without re-tokenizing the prompt with the
+        # audio placeholder expanded to one token per audio frame.
+        import torch
+        audio_inputs = dict(self.processor.audio_processor(wavs, device="cpu"))
+        sizes = audio_inputs.pop("audio_embed_sizes", None)
+        if sizes is None:
+            return None
+        tokenizer = self.processor.tokenizer
+        audio_token_id = tokenizer.convert_tokens_to_ids(self.processor.audio_token)
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        rows = [prefix + [audio_token_id] * int(size) + suffix for size in sizes]
+        width = max(len(row) for row in rows)
+        input_ids = torch.full((len(rows), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for index, row in enumerate(rows):
+            # Left padded, like the tokenizer is set up to do.
+            input_ids[index, width - len(row):] = torch.tensor(row, dtype=torch.long)
+            attention_mask[index, width - len(row):] = 1
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, **audio_inputs}
+        return {key: value.to(self.device) if isinstance(value, torch.Tensor) else value for key, value in inputs.items()}
+
+    def _end_token_ids(self) -> list[int]:
+        # EOS from the generation config (an id or a list of them) and the tokenizer, and the pad token.
+        tokenizer = self.processor.tokenizer
+        ids = self.model.generation_config.eos_token_id
+        ids = list(ids) if isinstance(ids, (list, tuple)) else [ids]
+        ids += [tokenizer.eos_token_id, tokenizer.pad_token_id]
+        return sorted({int(id) for id in ids if id is not None})
+
+    def transcribe_batch(self, samples_list: list[np.ndarray], sample_rate: int) -> list[str]:
+        import torch
+        if sample_rate != self.sample_rate:
+            raise RuntimeError(f"GraniteSpeech4p1x2B expects {self.sample_rate}Hz audio, got {sample_rate}Hz.")
+        tokenizer = self.processor.tokenizer
+        prompt, prefix, suffix = self._encoded_prompt()
+        texts = [""] * len(samples_list)
+        for bucket in shared.length_buckets([len(samples) for samples in samples_list], MAX_BATCH_SIZE):
+            wavs = [torch.from_numpy(np.ascontiguousarray(samples_list[index], dtype=np.float32)) for index in bucket]
+            inputs = None
+            if prefix is not None and suffix is not None:
+                inputs = self._build_inputs(wavs, prefix, suffix)
+            if inputs is None:
+                inputs = self.processor(
+                    [prompt] * len(bucket),
+                    wavs,
+                    return_tensors="pt",
+                    padding=True,
+                ).to(self.device)
+            prompt_len = inputs["input_ids"].shape[-1]
+            longest = max(len(samples_list[index]) for index in bucket) / sample_rate
+            max_new_tokens = self.min_new_tokens_budget + int(np.ceil(longest * self.max_tokens_per_second))
+            from transformers import StoppingCriteriaList
+            stopping_criteria = StoppingCriteriaList()
+            stopper = None
+            if self.repetition_limit > 1:
+                stopper = repetition_stopper(prompt_len, len(bucket), self.repetition_limit, self._end_token_ids())
+                stopping_criteria.append(stopper)
+            output = self.model.generate(
+                **inputs,
+                do_sample=False,
+                num_beams=1,
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=stopping_criteria,
+            )
+            generated = [output[row, prompt_len:] for row in range(len(bucket))]
+            if stopper is not None:
+                for row, cut in enumerate(stopper.cut):
+                    if cut is not None:
+                        print(f"Stopped a repetition loop after {cut} tokens.")
+                        generated[row] = generated[row][:cut]
+            decoded = [tokenizer.decode(tokens, skip_special_tokens=True) for tokens in generated]
+            for index, text in zip(bucket, decoded):
+                texts[index] = text
+        return texts
 
     def supports_prompting(self):
         return True
@@ -102,4 +224,6 @@ class GraniteSpeech4p1x2B(shared.SimpleASRModel):
         return self._default_prompt
     
     def set_prompt(self, prompt: str):
+        if prompt != self.prompt:
+            self._prompt_cache = None
         self.prompt = prompt
\ No newline at end of file
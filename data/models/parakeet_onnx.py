@@ -0,0 +1,241 @@
+import shared
+import json
+import os
+import re
+import shutil
+import numpy as np
+from models.parakeetv2 import ensure_downloaded
+
+# Parakeet TDT on onnxruntime's CPU provider. The first start exports the encoder and the
+# decoder+joint network from the .nemo file with NeMo, next to path_to_model. Later starts
+# only import onnxruntime. The mel spectrogram is computed here with numpy, from the
+# filterbank and window saved out of NeMo's preprocessor.
+
+EXPORT_VERSION = 1
+BYTE_PIECE = re.compile(r"^<0x([0-9A-Fa-f]{2})>$")
+
+class MelFrontend:
+    def __init__(self, config: dict, filterbank: np.ndarray, window: np.ndarray):
+        self.n_fft = config["n_fft"]
+        self.hop_length = config["hop_length"]
+        self.preemph = config["preemph"]
+        self.mag_power = config["mag_power"]
+        self.log_guard = config["log_zero_guard_value"]
+        self.normalize = config["normalize"]
+        self.pad_to = config["pad_to"]
+        self.pad_value = config["pad_value"]
+        self.pad_mode = config["pad_mode"]
+        self.filterbank = filterbank.astype(np.float32)
+        # torch.stft centers a shorter window inside n_fft.
+        self.window = np.zeros(self.n_fft, dtype=np.float32)
+        offset = (self.n_fft - len(window)) // 2
+        self.window[offset:offset + len(window)] = window
+
+    def __call__(self, samples: np.ndarray) -> tuple[np.ndarray, int]:
+        # Returns features shaped (1, mels, frames) and the number of valid frames.
+        x = np.asarray(samples, dtype=np.float32)
+        length = len(x)
+        if self.preemph:
+            x = np.concatenate((x[:1], x[1:] - np.float32(self.preemph) * x[:-1]))
+        pad = self.n_fft // 2
+        x = np.pad(x, (pad, pad), mode=self.pad_mode)
+        frames = np.lib.stride_tricks.sliding_window_view(x, self.n_fft)[::self.hop_length]
+        spectrum = np.fft.rfft(frames * self.window, n=self.n_fft)
+        power = np.abs(spectrum).astype(np.float32)
+        if self.mag_power != 1.0:
+            power **= np.float32(self.mag_power)
+        mel = np.log(self.filterbank @ power.T + np.float32(self.log_guard))
+        valid = max(0, (length + 2 * pad - self.n_fft) // self.hop_length)
+        if self.normalize == "per_feature" and valid > 1:
+            mean = mel[:, :valid].mean(axis=1, keepdims=True)
+            std = np.sqrt(((mel[:, :valid] - mean) ** 2).sum(axis=1, keepdims=True) / (valid - 1)) + np.float32(1e-5)
+            mel = (mel - mean) / std
+        mel[:, valid:] = self.pad_value
+        if self.pad_to > 0 and mel.shape[1] % self.pad_to != 0:
+            extra = self.pad_to - mel.shape[1] % self.pad_to
+            mel = np.pad(mel, ((0, 0), (0, extra)), constant_values=self.pad_value)
+        return mel[np.newaxis].astype(np.float32), valid
+
+def decode_pieces(pieces: list[str]) -> str:
+    # SentencePiece detokenization, including byte fallback pieces.
+    output = bytearray()
+    for piece in pieces:
+        match = BYTE_PIECE.match(piece)
+        if match:
+            output.append(int(match.group(1), 16))
+        else:
+            output.extend(piece.replace("▁", " ").encode("utf-8"))
+    return output.decode("utf-8", errors="replace").strip()
+
+def _onnx_dtype(type_name: str) -> type:
+    return {"tensor(int32)": np.int32, "tensor(int64)": np.int64, "tensor(float)": np.float32}[type_name]
+
+def export(model_path: str, export_dir: str, state: shared.ModelLoadingState):
+    state.settext("Exporting parakeet to ONNX (only happens once)...")
+    print("Initalizing nemo...")
+    import torch
+    import nemo.collections.asr as nemo_asr
+    state.checkpoints.checkpoint("loading nemo_asr")
+    model = nemo_asr.models.ASRModel.restore_from(model_path, map_location=torch.device("cpu")) # type: ignore
+    model.eval()
+    state.checkpoints.checkpoint("loading model for export")
+    partial_dir = export_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+    with torch.inference_mode():
+        model.export(os.path.join(partial_dir, "model.onnx")) # type: ignore
+    state.checkpoints.checkpoint("exporting to ONNX")
+    featurizer = model.preprocessor.featurizer # type: ignore
+    guard = featurizer.log_zero_guard_value
+    config = {
+        "version": EXPORT_VERSION,
+        "sample_rate": int(model.cfg.preprocessor.sample_rate), # type: ignore
+        "n_fft": int(featurizer.n_fft),
+        "hop_length": int(featurizer.hop_length),
+        "preemph": float(featurizer.preemph) if featurizer.preemph is not None else 0.0,
+        "mag_power": float(featurizer.mag_power),
+        "log_zero_guard_value": float(guard(torch.zeros(1)) if callable(guard) else guard),
+        "normalize": featurizer.normalize,
+        "pad_to": int(featurizer.pad_to) if isinstance(featurizer.pad_to, int) else 0,
+        "pad_value": float(featurizer.pad_value),
+        "pad_mode": "constant",
+        "vocabulary": list(model.tokenizer.ids_to_tokens(list(range(model.tokenizer.vocab_size)))), # type: ignore
+        "durations": [int(duration) for duration in model.cfg.model_defaults.get("tdt_durations", [])], # type: ignore
+        "max_symbols": int(model.cfg.decoding.greedy.get("max_symbols", 10) or 10), # type: ignore
+    }
+    filterbank = featurizer.fb.squeeze(0).numpy()
+    window = featurizer.window.numpy()
+    np.savez(os.path.join(partial_dir, "frontend.npz"), filterbank=filterbank, window=window)
+    # Check the numpy frontend against NeMo's before trusting it. The padding mode of the
+    # STFT isn't exposed, so take whichever one matches.
+    test = np.random.default_rng(0).standard_normal(16000 * 2).astype(np.float32) * 0.1
+    with torch.inference_mode():
+        expected, expected_length = model.preprocessor(input_signal=torch.from_numpy(test)[None], length=torch.tensor([len(test)])) # type: ignore
+    expected = expected[0].numpy()
+    best_error = None
+    for pad_mode in ("constant", "reflect"):
+        config["pad_mode"] = pad_mode
+        features, valid = MelFrontend(config, filterbank, window)(test)
+        if valid != int(expected_length[0]) or features.shape[2] != expected.shape[1]:
+            continue
+        error = float(np.abs(features[0, :, :valid] - expected[:, :valid]).max())
+        if best_error is None or error < best_error[0]:
+            best_error = (error, pad_mode)
+    if best_error is None:
+        raise RuntimeError("The ONNX mel frontend doesn't produce the same number of frames as NeMo's preprocessor.")
+    config["pad_mode"] = best_error[1]
+    print(f"ONNX mel frontend matches NeMo's to within {best_error[0]:.2e} (pad mode {best_error[1]}).")
+    if best_error[0] > 1e-2:
+        print("Warning: the ONNX mel frontend differs noticeably from NeMo's. Transcriptions may not match the parakeet model exactly.")
+    with open(os.path.join(partial_dir, "config.json"), "w", encoding="utf-8") as file:
+        json.dump(config, file)
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.replace(partial_dir, export_dir)
+    state.checkpoints.checkpoint("saving ONNX export")
+
+class ParakeetONNX(shared.SimpleASRModel):
+    def __init__(self, state: shared.ModelLoadingState):
+        super().__init__(state)
+        model_path = ensure_downloaded(state)
+        state.show_spinner()
+        export_dir = f"{model_path}.onnx-{shared.model_source_key(model_path)}"
+        if not os.path.exists(os.path.join(export_dir, "config.json")):
+            export(model_path, export_dir, state)
+        state.settext("Loading parakeet (ONNX)...")
+        import onnxruntime
+        state.checkpoints.checkpoint("loading onnxruntime")
+        with open(os.path.join(export_dir, "config.json"), "r", encoding="utf-8") as file:
+            config = json.load(file)
+        frontend = np.load(os.path.join(export_dir, "frontend.npz"))
+        self.frontend = MelFrontend(config, frontend["filterbank"], frontend["window"])
+        self._sample_rate = config["sample_rate"]
+        self.vocabulary: list[str] = config["vocabulary"]
+        self.blank = len(self.vocabulary)
+        self.durations: list[int] = config["durations"]
+        self.max_symbols: int = config["max_symbols"]
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(state.get_option_number("onnx_threads", 0))
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        providers = ["CPUExecutionProvider"]
+        self.encoder = onnxruntime.InferenceSession(os.path.join(export_dir, "encoder-model.onnx"), options, providers=providers)
+        self.decoder_joint = onnxruntime.InferenceSession(os.path.join(export_dir, "decoder_joint-model.onnx"), options, providers=providers)
+        state.checkpoints.checkpoint("loading ONNX sessions")
+        encoder_inputs = self.encoder.get_inputs()
+        self.encoder_signal = encoder_inputs[0].name
+        self.encoder_length = encoder_inputs[1].name
+        self.encoder_length_type = _onnx_dtype(encoder_inputs[1].type)
+        decoder_inputs = self.decoder_joint.get_inputs()
+        self.decoder_names = [node.name for node in decoder_inputs[:3]]
+        self.target_type = _onnx_dtype(decoder_inputs[1].type)
+        self.length_type = _onnx_dtype(decoder_inputs[2].type)
+        self.state_inputs = [node for node in decoder_inputs[3:]]
+        shared.remove_stale_caches(f"{model_path}.onnx-", export_dir)
+
+    @property
+    def sample_rate(self) -> int:
+        return self._sample_rate
+
+    def _initial_states(self) -> list[np.ndarray]:
+        return [np.zeros([dimension if isinstance(dimension, int) else 1 for dimension in node.shape], dtype=np.float32) for node in self.state_inputs]
+
+    def _greedy_decode(self, encoded: np.ndarray, length: int) -> list[int]:
+        # encoded is (dimensions, frames). Same greedy TDT search as NeMo's GreedyTDTInfer;
+        # with no durations it is plain RNNT greedy search.
+        tokens: list[int] = []
+        states = self._initial_states()
+        last_token = self.blank
+        duration_count = len(self.durations)
+        frame = 0
+        while frame < length:
+            step = np.ascontiguousarray(encoded[np.newaxis, :, frame:frame + 1])
+            symbols_added = 0
+            need_loop = True
+            while need_loop and symbols_added < self.max_symbols:
+                feed = {
+                    self.decoder_names[0]: step,
+                    self.decoder_names[1]: np.array([[last_token]], dtype=self.target_type),
+                    self.decoder_names[2]: np.array([1], dtype=self.length_type),
+                }
+                for node, value in zip(self.state_inputs, states):
+                    feed[node.name] = value
+                outputs = self.decoder_joint.run(None, feed)
+                logits = outputs[0].reshape(-1)
+                if duration_count > 0:
+                    token = int(np.argmax(logits[:-duration_count]))
+                    skip = self.durations[int(np.argmax(logits[-duration_count:]))]
+                else:
+                    token = int(np.argmax(logits))
+                    skip = 1 if token == self.blank else 0
+                if token == self.blank:
+                    if skip == 0:
+                        skip = 1
+                else:
+                    tokens.append(token)
+                    last_token = token
+                    states = outputs[2:]
+                symbols_added += 1
+                frame += skip
+                need_loop = skip == 0
+            if symbols_added == self.max_symbols:
+                frame += 1
+        return tokens
+
+    def transcribe(self, file: str) -> str:
+        import soundfile as sf
+        wav, sr = sf.read(file, dtype="float32") # type: ignore
+        if len(wav.shape) > 1:
+            wav = wav.mean(axis=1)
+        return self.transcribe_array(wav, sr)
+
+    def transcribe_array(self, samples: np.ndarray, sample_rate: int) -> str:
+        if sample_rate != self.sample_rate:
+            raise RuntimeError(f"ParakeetONNX expects {self.sample_rate}Hz audio, got {sample_rate}Hz.")
+        features, valid = self.frontend(samples)
+        encoded, encoded_lengths = self.encoder.run(None, {
+            self.encoder_signal: features,
+            self.encoder_length: np.array([valid], dtype=self.encoder_length_type),
+        })[:2]
+        tokens = self._greedy_decode(encoded[0], int(encoded_lengths[0]))
+        return decode_pieces([self.vocabulary[token] for token in tokens])
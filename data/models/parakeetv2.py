@@ -1,26 +1,83 @@
 import shared
+import hashlib
 import os
+import shutil
+import tarfile
+import typing
+import numpy as np
+
+MAX_BATCH_SIZE = 8
+MODEL_FILENAME = "parakeet-tdt-0.6b-v2.nemo"
+
+def ensure_downloaded(state: shared.ModelLoadingState) -> str:
+    model_path = f"{state.model_dir}{MODEL_FILENAME}"
+    if not os.path.exists(model_path):
+        state.hide_spinner()
+        if not state.ask_allow_or_deny(f"Could not find \"{model_path}\". Allow fetching from \"https://huggingface.co/nvidia/parakeet-tdt-0.6b-v2\"?"):
+            state.quit()
+        state.show_spinner()
+        state.settext("Downloading parakeet-tdt-0.6b-v2.nemo...")
+        from huggingface_hub import hf_hub_download
+        state.checkpoints.ignore()
+        hf_hub_download(
+            repo_id="nvidia/parakeet-tdt-0.6b-v2",
+            filename=MODEL_FILENAME,
+            local_dir=state.model_dir,
+            local_dir_use_symlinks=False
+            )
+        state.checkpoints.checkpoint("downloading model")
+    return model_path
+
+def archive_key(model_path: str) -> str:
+    # Size and mtime, plus a hash of the start and end of the archive. Hashing all of it
+    # would take longer than the extraction this avoids.
+    digest = hashlib.sha256()
+    size = os.path.getsize(model_path)
+    with open(model_path, "rb") as file:
+        digest.update(file.read(1 << 20))
+        file.seek(max(0, size - (1 << 20)))
+        digest.update(file.read(1 << 20))
+    return f"{shared.model_source_key(model_path)}-{digest.hexdigest()[:16]}"
+
+def extracted_model_dir(model_path: str, state: shared.ModelLoadingState) -> str:
+    # restore_from() untars the whole .nemo into a temporary folder on every start. Keep
+    # one extracted copy next to the archive instead and restore from that.
+    extracted = f"{model_path}.extracted-{archive_key(model_path)}"
+    if os.path.exists(os.path.join(extracted, "model_config.yaml")):
+        return extracted
+    state.settext("Extracting parakeet-tdt-0.6b-v2.nemo (only happens once)...")
+    partial = extracted + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    with tarfile.open(model_path, "r:*") as archive:
+        try:
+            archive.extractall(partial, filter="data")
+        except TypeError:
+            archive.extractall(partial)
+    if not os.path.exists(os.path.join(partial, "model_config.yaml")):
+        shutil.rmtree(partial, ignore_errors=True)
+        raise RuntimeError(f"\"{model_path}\" doesn't contain a model_config.yaml. Is it a .nemo file?")
+    os.replace(partial, extracted)
+    shared.remove_stale_caches(f"{model_path}.extracted-", extracted)
+    state.checkpoints.checkpoint("extracting model archive")
+    return extracted
+
+def restore_model(model_path: str, state: shared.ModelLoadingState, map_location: typing.Any = None) -> typing.Any:
+    import nemo.collections.asr as nemo_asr
+    from nemo.core.connectors.save_restore_connector import SaveRestoreConnector
+    try:
+        extracted = extracted_model_dir(model_path, state)
+    except Exception as e:
+        print(f"Couldn't use an extracted copy of {model_path}, restoring from the archive: ({type(e).__name__}) {e}")
+        return nemo_asr.models.ASRModel.restore_from(model_path, map_location=map_location) # type: ignore
+    state.settext("Loading parakeet-tdt-0.6b-v2.nemo...")
+    connector = SaveRestoreConnector()
+    connector.model_extracted_dir = extracted
+    return nemo_asr.models.ASRModel.restore_from(model_path, map_location=map_location, save_restore_connector=connector) # type: ignore
 
 class ParakeetV2(shared.SimpleASRModel):
     def __init__(self, state: shared.ModelLoadingState):
         super().__init__(state)
-        model_filename = "parakeet-tdt-0.6b-v2.nemo"
-        model_path = f"{state.model_dir}{model_filename}"
-        if not os.path.exists(model_path):
-            state.hide_spinner()
-            if not state.ask_allow_or_deny(f"Could not find \"{model_path}\". Allow fetching from \"https://huggingface.co/nvidia/parakeet-tdt-0.6b-v2\"?"):
-                state.quit()
-            state.show_spinner()
-            state.settext("Downloading parakeet-tdt-0.6b-v2.nemo...")
-            from huggingface_hub import hf_hub_download
-            state.checkpoints.ignore()
-            hf_hub_download(
-                repo_id="nvidia/parakeet-tdt-0.6b-v2",
-                filename=model_filename,
-                local_dir=state.model_dir,
-                local_dir_use_symlinks=False
-                )
-            state.checkpoints.checkpoint("downloading model")
+        model_path = ensure_downloaded(state)
         state.show_spinner()
         state.checkpoints.checkpoint("preload pytorch")
         state.load_and_check_torch()
@@ -31,12 +88,72 @@ class ParakeetV2(shared.SimpleASRModel):
         state.checkpoints.checkpoint("loading nemo_asr")
         print("Initialized.")
         state.settext("Loading parakeet-tdt-0.6b-v2.nemo...")
-        self.asr_model = nemo_asr.models.ASRModel.restore_from(model_path) # type: ignore
-        state.checkpoints.checkpoint("loading model")
+        import torch
+        if state.cpu_int8 and not torch.cuda.is_available():
+            self.asr_model = shared.load_int8_cpu_model(lambda: restore_model(model_path, state, map_location=torch.device("cpu")), model_path, state)
+        else:
+            self.asr_model = restore_model(model_path, state)
+            state.checkpoints.checkpoint("loading model")
         self.device = next(self.asr_model.parameters()).device # type: ignore
         print(f"Model device: {self.device}")
         if self.device.type == "cpu" and not state.allow_cpu:
             state.show_cpu_warning()
-    
+        # transcribe() builds a manifest, a dataloader and a decoding config per call, which
+        # costs more than decoding a short clip. The direct path feeds tensors straight
+        # through the preprocessor, encoder and decoder instead.
+        self.direct_inference = bool(state.get_option_number("direct_inference", 1))
+        self.asr_model.eval() # type: ignore
+        featurizer = self.asr_model.preprocessor.featurizer # type: ignore
+        # Same settings transcribe() switches to for inference.
+        featurizer.dither = 0.0
+        featurizer.pad_to = 0
+
+    @property
+    def sample_rate(self) -> int:
+        return int(self.asr_model.cfg.get("sample_rate", 16000)) # type: ignore
+
     def transcribe(self, file: str) -> str:
-        return self.asr_model.transcribe([file])[0].text # type: ignore
\ No newline at end of file
+        return self.asr_model.transcribe([file])[0].text # type: ignore
+
+    def transcribe_array(self, samples: np.ndarray, sample_rate: int) -> str:
+        return self.transcribe_batch([samples], sample_rate)[0]
+
+    def _decode_direct(self, audio: list[np.ndarray]) -> list[str]:
+        import torch
+        lengths = torch.tensor([len(samples) for samples in audio], dtype=torch.long)
+        signal = torch.zeros((len(audio), int(lengths.max())), dtype=torch.float32)
+        for row, samples in enumerate(audio):
+            signal[row, :len(samples)] = torch.from_numpy(samples)
+        with torch.inference_mode():
+            signal = signal.to(self.device)
+            lengths = lengths.to(self.device)
+            features, feature_lengths = self.asr_model.preprocessor(input_signal=signal, length=lengths) # type: ignore
+            encoded, encoded_lengths = self.asr_model.encoder(audio_signal=features, length=feature_lengths) # type: ignore
+            hypotheses = self.asr_model.decoding.rnnt_decoder_predictions_tensor(encoder_output=encoded, encoded_lengths=encoded_lengths, return_hypotheses=False) # type: ignore
+        # Older NeMo versions return (best, all).
+        if isinstance(hypotheses, tuple):
+            hypotheses = hypotheses[0]
+        return [hypothesis.text if hasattr(hypothesis, "text") else str(hypothesis) for hypothesis in hypotheses]
+
+    def _decode_nemo(self, audio: list[np.ndarray]) -> list[str]:
+        return [result.text for result in self.asr_model.transcribe(audio, batch_size=len(audio), verbose=False)] # type: ignore
+
+    def transcribe_batch(self, samples_list: list[np.ndarray], sample_rate: int) -> list[str]:
+        if sample_rate != self.sample_rate:
+            raise RuntimeError(f"ParakeetV2 expects {self.sample_rate}Hz audio, got {sample_rate}Hz.")
+        texts = [""] * len(samples_list)
+        # NeMo pads each batch to its longest clip, so keep similar lengths together.
+        for bucket in shared.length_buckets([len(samples) for samples in samples_list], MAX_BATCH_SIZE):
+            audio = [np.ascontiguousarray(samples_list[index], dtype=np.float32) for index in bucket]
+            results = None
+            if self.direct_inference:
+                try:
+                    results = self._decode_direct(audio)
+                except Exception as e:
+                    print(f"Direct parakeet inference failed, using transcribe() from now on: ({type(e).__name__}) {e}")
+                    self.direct_inference = False
+            if results is None:
+                results = self._decode_nemo(audio)
+            for index, text in zip(bucket, results):
+                texts[index] = text
+        return texts
@@ -0,0 +1,214 @@
+import math
+import numpy as np
+import time
+import typing
+
+def speech_bounds(samples: np.ndarray, rate: int, hangover: float = 0.2, frame_length: float = 0.02, margin_db: float = 12.0, floor_db: float = -60.0) -> tuple[int, int]:
+    # Frame energy plus zero-crossing rate. Returns (start, end) sample indices of the
+    # speech region, or the whole clip if nothing stands out from the noise floor.
+    frame = max(1, int(rate * frame_length))
+    count = len(samples) // frame
+    if count < 2:
+        return (0, len(samples))
+    frames = samples[:count * frame].reshape(count, frame)
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+    db = 10.0 * np.log10(energy + 1e-12)
+    noise_floor = np.percentile(db, 10)
+    if db.max() - noise_floor < margin_db:
+        return (0, len(samples))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+    loud = db > (noise_floor + margin_db)
+    # Fricatives ("s", "f") are quiet but cross zero a lot.
+    hissy = (db > (noise_floor + margin_db / 2)) & (zcr > 0.25)
+    speech = (loud | hissy) & (db > floor_db)
+    found = np.flatnonzero(speech)
+    if len(found) == 0:
+        return (0, len(samples))
+    hangover_frames = int(np.ceil(hangover * rate / frame))
+    start = max(0, found[0] - hangover_frames) * frame
+    last = found[-1] + 1 + hangover_frames
+    end = len(samples) if last >= count else last * frame
+    return (int(start), int(end))
+
+def pauses(samples: np.ndarray, rate: int, min_pause: float, frame_length: float = 0.02, margin_db: float = 12.0) -> list[int]:
+    # Sample indices in the middle of every run of at least min_pause seconds of quiet
+    # frames that has speech before it, in order.
+    frame = max(1, int(rate * frame_length))
+    count = len(samples) // frame
+    pause_frames = max(1, int(round(min_pause / frame_length)))
+    if count < pause_frames + 1:
+        return []
+    frames = samples[:count * frame].reshape(count, frame)
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+    db = 10.0 * np.log10(energy + 1e-12)
+    noise_floor = np.percentile(db, 10)
+    if db.max() - noise_floor < margin_db:
+        return []
+    quiet = np.concatenate(([False], db < (noise_floor + margin_db / 2), [False]))
+    edges = np.diff(quiet.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    long_enough = ((ends - starts) >= pause_frames) & (starts > 0)
+    return [int(middle) * frame for middle in (starts[long_enough] + ends[long_enough]) // 2]
+
+RESAMPLER_QUALITIES: dict[str, tuple[int, float]] = {
+    # Filter half-length per unit of max(up, down), and Kaiser beta.
+    "fast": (10, 5.0),
+    "high": (32, 8.6),
+}
+
+class PolyphaseResampler:
+    def __init__(self, source_rate: int, target_rate: int, quality: str = "fast"):
+        if quality not in RESAMPLER_QUALITIES:
+            raise RuntimeError(f"Unknown resampler quality \"{quality}\". Expected one of {', '.join(RESAMPLER_QUALITIES.keys())}.")
+        import scipy.signal
+        self._resample_poly = scipy.signal.resample_poly
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        divisor = math.gcd(source_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = source_rate // divisor
+        # Design the anti-aliasing filter once instead of on every call. float32 taps keep
+        # the output float32.
+        half_length, beta = RESAMPLER_QUALITIES[quality]
+        max_rate = max(self.up, self.down)
+        self.taps = scipy.signal.firwin(2 * half_length * max_rate + 1, 1.0 / max_rate, window=("kaiser", beta)).astype(np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        return self._resample_poly(samples, self.up, self.down, window=self.taps)
+
+class Stage:
+    name = "stage"
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        self.rate = rate
+        self.last_time = 0.0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        # May modify samples in place. Returns the (possibly new) array.
+        raise NotImplementedError()
+
+class ResampleStage(Stage):
+    name = "resample"
+    output_rate: int
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        super().__init__(rate, settings)
+        self.output_rate = settings["model_rate"]
+        self.resampler = PolyphaseResampler(rate, self.output_rate, settings.get("resampler_quality", "fast"))
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        return self.resampler.process(samples)
+
+class DCRemovalStage(Stage):
+    name = "dc_removal"
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        samples -= samples.mean(dtype=np.float64)
+        return samples
+
+class HighPassStage(Stage):
+    name = "highpass"
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        super().__init__(rate, settings)
+        import scipy.signal
+        self._sosfilt = scipy.signal.sosfilt
+        self.sos = scipy.signal.butter(4, settings.get("highpass_cutoff", 80.0), btype="highpass", fs=rate, output="sos")
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        samples[:] = self._sosfilt(self.sos, samples)
+        return samples
+
+class TrimStage(Stage):
+    name = "trim"
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        super().__init__(rate, settings)
+        self.hangover = settings.get("vad_hangover", 0.2)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        start, end = speech_bounds(samples, self.rate, hangover=self.hangover)
+        ms_per_sample = 1000 / self.rate
+        print(f"VAD trimmed {start * ms_per_sample:.0f}ms leading and {(len(samples) - end) * ms_per_sample:.0f}ms trailing audio from {len(samples) * ms_per_sample:.0f}ms.")
+        return samples[start:end]
+
+class PadStage(Stage):
+    name = "pad"
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        super().__init__(rate, settings)
+        self.min_samples = int(settings.get("minimum_length", 0.0) * rate)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if len(samples) >= self.min_samples:
+            return samples
+        padded = np.zeros(self.min_samples, dtype=samples.dtype)
+        padded[:len(samples)] = samples
+        return padded
+
+class NormalizeStage(Stage):
+    name = "normalize"
+
+    def __init__(self, rate: int, settings: dict[str, typing.Any]):
+        super().__init__(rate, settings)
+        import pyloudnorm
+        # Building the meter designs its K-weighting filters, so do it once.
+        self.meter = pyloudnorm.Meter(rate)
+        self.target_lufs = settings.get("target_lufs", -18.0)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        loudness = self.meter.integrated_loudness(samples)
+        if not np.isfinite(loudness):
+            return samples
+        samples *= np.float32(10.0 ** ((self.target_lufs - loudness) / 20.0))
+        return samples
+
+class ClipStage(Stage):
+    name = "clip"
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        return np.clip(samples, -1.0, 1.0, out=samples)
+
+STAGES: dict[str, type[Stage]] = {
+    ResampleStage.name: ResampleStage,
+    DCRemovalStage.name: DCRemovalStage,
+    HighPassStage.name: HighPassStage,
+    TrimStage.name: TrimStage,
+    PadStage.name: PadStage,
+    NormalizeStage.name: NormalizeStage,
+    ClipStage.name: ClipStage,
+}
+
+class AudioPipeline:
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+
+    @staticmethod
+    def build(names: list[str], rate: int, settings: dict[str, typing.Any]) -> "AudioPipeline":
+        # rate is the capture rate. Stages after "resample" see settings["model_rate"] instead.
+        stages = []
+        for name in names:
+            stage = STAGES.get(name)
+            if stage is None:
+                raise RuntimeError(f"Unknown audio pipeline stage \"{name}\". Expected one of {', '.join(STAGES.keys())}.")
+            built = stage(rate, settings)
+            rate = getattr(built, "output_rate", rate)
+            stages.append(built)
+        if rate != settings.get("model_rate", rate):
+            raise RuntimeError(f"Audio pipeline ends at {rate}Hz but the model expects {settings['model_rate']}Hz. Add a \"resample\" stage.")
+        return AudioPipeline(stages)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        # samples must be a float32 array that the pipeline is allowed to modify.
+        for stage in self.stages:
+            start = time.perf_counter()
+            samples = stage.process(samples)
+            stage.last_time = time.perf_counter() - start
+        return samples
+
+    def timings(self) -> str:
+        return ", ".join(f"{stage.name}: {stage.last_time * 1000:.2f}ms" for stage in self.stages)
@@ -10,6 +10,7 @@ import io
 from tkinter import messagebox
 import traceback
 import functools
+import collections
 import types
 import ctypes
 import ctypes.wintypes
@@ -17,6 +18,10 @@ import uuid
 import re
 import tomllib
 import inspect
+import tempfile
+import shutil
+import wave
+import numpy as np
 
 T = typing.TypeVar("T")
 
@@ -469,6 +474,8 @@ class Checkpoint:
 class ModelInitCancelledError(RuntimeError):
     pass
 
+_ask_lock = threading.Lock()
+
 class SharedLoadingState:
     def __init__(self, window: tk.Tk, settext: typing.Callable[[str], typing.Any]):
         self.window = window
@@ -513,6 +520,12 @@ class SharedLoadingState:
         return typing.cast(T, value)
 
     def ask_allow_or_deny(self, text: str) -> bool:
+        # Plugins can load in parallel with each other and the ASR model, so only show
+        # one question at a time.
+        with _ask_lock:
+            return self._ask_allow_or_deny(text)
+
+    def _ask_allow_or_deny(self, text: str) -> bool:
         self.settext(text)
         def _resize_window_first():
             if self.window.winfo_width() < 500:
@@ -633,7 +646,9 @@ class ModelLoadingState(SharedLoadingState):
                  model_dir: str,
                  prompt: str,
                  model_keywords: list[str],
-                 allow_cpu: bool
+                 allow_cpu: bool,
+                 model_options: dict[str, typing.Any] | None = None,
+                 cpu_int8: bool = False
                  ):
         super().__init__(window, settext)
         self.quit = quit
@@ -644,8 +659,19 @@ class ModelLoadingState(SharedLoadingState):
         self.hide_spinner = hide_spinner
         self.model_keywords = model_keywords
         self.prompt = prompt
+        self.model_options = model_options if model_options is not None else {}
+        self.cpu_int8 = cpu_int8
         self.checkpoints = Checkpoint()
 
+    def get_option_number(self, option_name: str, default: float) -> float:
+        # From [meta.model_options] in the config.
+        option = self.model_options.get(option_name)
+        if option is None:
+            return default
+        if type(option) not in (int, float):
+            raise RuntimeError(f"model_options has a {type(option).__name__} for \"{option_name}\" instead of a number. Fix this in {CONFIG_FILENAME}!")
+        return option
+
     def show_cpu_warning(self):
         def confirm_cpu():
             messagebox.showwarning("STT Loaded to CPU", "The speech-to-text model was loaded to your CPU.\nDisable this warning in the config by changing warn_on_cpu to false.")
@@ -814,10 +840,38 @@ class ModelLoadingState(SharedLoadingState):
 class SimpleASRModel:
     def __init__(self, state: ModelLoadingState):
         self.state = state
+
+    @property
+    def sample_rate(self) -> int:
+        # Rate that transcribe_array() expects. Audio is resampled to this before it gets here.
+        return 16000
     
     def transcribe(self, file: str) -> str:
         raise NotImplementedError()
+
+    def transcribe_array(self, samples: np.ndarray, sample_rate: int) -> str:
+        # Fallback for models that only implement transcribe(file).
+        # Built-in models override this and take the float32 buffer directly.
+        handle, filename = tempfile.mkstemp(prefix="stt_", suffix=".wav")
+        os.close(handle)
+        try:
+            samples_int16 = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+            with wave.open(filename, "wb") as file:
+                file.setnchannels(1)
+                file.setsampwidth(2)
+                file.setframerate(sample_rate)
+                file.writeframes(samples_int16.tobytes())
+            return self.transcribe(filename)
+        finally:
+            try:
+                os.remove(filename)
+            except OSError as e:
+                print(f"Couldn't remove temporary audio file {filename}: ({type(e).__name__}) {e}")
     
+    def transcribe_batch(self, samples_list: list[np.ndarray], sample_rate: int) -> list[str]:
+        # One result per input, in order. Built-in models batch these into fewer forward passes.
+        return [self.transcribe_array(samples, sample_rate) for samples in samples_list]
+
     def supports_prompting(self) -> bool:
         return False
     
@@ -827,6 +881,147 @@ class SimpleASRModel:
     def set_prompt(self, prompt: str):
         raise NotImplementedError()
 
+def model_source_key(path: str) -> str:
+    # Changes whenever the model file, or any file in the model folder, is replaced.
+    files = [path] if os.path.isfile(path) else sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    total = 0
+    latest = 0
+    for file in files:
+        info = os.stat(file)
+        total += info.st_size
+        latest = max(latest, int(info.st_mtime))
+    return f"{total:x}-{latest:x}"
+
+def remove_stale_caches(prefix: str, keep: str):
+    # Deletes the files and folders starting with prefix that older model or library
+    # versions left next to the current cache, keep.
+    folder = os.path.dirname(prefix) or "."
+    for name in os.listdir(folder):
+        if not name.startswith(os.path.basename(prefix)) or name == os.path.basename(keep):
+            continue
+        path = os.path.join(folder, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def library_versions_key() -> str:
+    # Changes whenever python, torch, nemo or transformers is upgraded. Pickled modules
+    # rebuild their objects with whatever classes are installed, so a pickle from older
+    # versions can load fine and still behave differently.
+    import hashlib
+    from importlib import metadata
+    versions = [f"python {sys.version_info.major}.{sys.version_info.minor}"]
+    for package in ("torch", "nemo_toolkit", "transformers"):
+        try:
+            versions.append(f"{package} {metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package} none")
+    return hashlib.sha256(", ".join(versions).encode()).hexdigest()[:12]
+
+def load_int8_cpu_model(load: typing.Callable[[], typing.Any], source_path: str, state: ModelLoadingState) -> typing.Any:
+    # Dynamic int8 quantization of the Linear layers, for running without CUDA. The
+    # quantized module is pickled next to the source so later starts skip both the fp32
+    # load and the quantization. The cache is keyed on the library versions as well as
+    # the model file, since the pickle depends on both.
+    import torch
+    base = source_path.rstrip("/\\")
+    cache_filename = f"{base}.int8-{model_source_key(source_path)}-{library_versions_key()}.pt"
+    if os.path.exists(cache_filename):
+        try:
+            model = torch.load(cache_filename, map_location="cpu", weights_only=False)
+            state.checkpoints.checkpoint("loading int8 model from cache")
+            return model
+        except Exception as e:
+            print(f"Couldn't load the int8 model cache {cache_filename}, quantizing again: ({type(e).__name__}) {e}")
+    model = load()
+    state.checkpoints.checkpoint("loading model")
+    state.settext("Quantizing the model to int8 (only happens once)...")
+    # LoRA adapters wrap their base Linear and read its weight directly, so leave those alone.
+    names = {name for name, module in model.named_modules() if type(module) is torch.nn.Linear and "lora_" not in name and not name.endswith("base_layer")}
+    model = torch.ao.quantization.quantize_dynamic(model, {name: torch.ao.quantization.default_dynamic_qconfig for name in names}, inplace=True)
+    state.checkpoints.checkpoint(f"quantizing {len(names)} linear layers to int8")
+    try:
+        temporary = cache_filename + ".tmp"
+        torch.save(model, temporary)
+        os.replace(temporary, cache_filename)
+        remove_stale_caches(f"{base}.int8-", cache_filename)
+        state.checkpoints.checkpoint("saving int8 model cache")
+    except Exception as e:
+        print(f"Couldn't save the int8 model cache {cache_filename}: ({type(e).__name__}) {e}")
+    return model
+
+def length_buckets(lengths: list[int], max_batch_size: int, max_padding: float = 0.25) -> list[list[int]]:
+    # Groups indices so that each group holds items of similar length. Padding a group to
+    # its longest item then wastes at most max_padding of each shorter item's length.
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index])
+    buckets: list[list[int]] = []
+    current: list[int] = []
+    for index in order:
+        if len(current) > 0 and (len(current) >= max_batch_size or lengths[current[0]] < lengths[index] * (1.0 - max_padding)):
+            buckets.append(current)
+            current = []
+        current.append(index)
+    if len(current) > 0:
+        buckets.append(current)
+    return buckets
+
+def load_asr_model(chosen_model: str, state: ModelLoadingState) -> SimpleASRModel:
+    # chosen_model is "none", "parakeet", "parakeet_onnx", "granite", or the path to a .py file defining ASRModel.
+    if chosen_model == "none":
+        from models.fake_asr_model import FakeASRModel
+        print("Loading FakeASRModel...")
+        model = FakeASRModel(state)
+        print("Loaded FakeASRModel.")
+        return model
+    if chosen_model == "parakeet":
+        from models.parakeetv2 import ParakeetV2
+        print("Loading ParakeetV2...")
+        model = ParakeetV2(state)
+        print("Loaded ParakeetV2.")
+        return model
+    if chosen_model == "parakeet_onnx":
+        from models.parakeet_onnx import ParakeetONNX
+        print("Loading ParakeetONNX...")
+        model = ParakeetONNX(state)
+        print("Loaded ParakeetONNX.")
+        return model
+    if chosen_model == "granite":
+        from models.granite_speech import GraniteSpeech4p1x2B
+        print("Loading GraniteSpeech4p1x2B...")
+        model = GraniteSpeech4p1x2B(state)
+        print("Loaded GraniteSpeech4p1x2B.")
+        return model
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(chosen_model))[0], chosen_model)
+    if spec is None:
+        raise ImportError(f"Couldn't load ASR model {chosen_model} (spec was None)")
+    if spec.loader is None:
+        raise ImportError(f"Couldn't load ASR model {chosen_model} (spec {spec} had None loader)")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not hasattr(module, "ASRModel"):
+        raise ImportError(f"While loading a user-defined ASR model, couldn't find the class \"ASRModel\". Did you name your class something else? Ensure that your model is named \"ASRModel\" exactly. ({chosen_model} does not have an ASRModel attribute.)")
+    return module.ASRModel(state)
+
+def warmup_audio(rate: int, length: float, seed: int = 0) -> np.ndarray:
+    # Quiet noise around a voiced-sounding burst, so VAD trimming keeps most of it.
+    rng = np.random.default_rng(seed)
+    count = int(rate * length)
+    t = np.arange(count, dtype=np.float32) / rate
+    voiced = sum(np.sin(2 * np.pi * 140.0 * harmonic * t) / harmonic for harmonic in range(1, 8))
+    envelope = np.clip(np.sin(np.pi * t / length) * 2.0, 0.0, 1.0)
+    samples = (0.2 * voiced * envelope + 0.003 * rng.standard_normal(count)).astype(np.float32)
+    return samples
+
+def warm_up_model(model: SimpleASRModel, prepare: typing.Callable[[np.ndarray], np.ndarray], rate: int, passes: int, checkpoints: Checkpoint, length: float = 2.0):
+    # The first inference pays for CUDA autotuning, lazy kernels, allocator growth and
+    # page faults on the weights. Pay it here, through the same preprocessing as record().
+    for index in range(passes):
+        text = model.transcribe_array(prepare(warmup_audio(rate, length, seed=index)), model.sample_rate)
+        checkpoints.checkpoint(f"warm-up pass {index + 1}")
+        verbose_print(f"Warm-up pass {index + 1} transcribed \"{text}\"")
+
 class Timer:
     def __init__(self):
         self.start = time.monotonic()
@@ -849,4 +1044,46 @@ class Timer:
         return self.time() * 1000
     
     def timemstrnc(self) -> str:
-        return f"{self.timems():.2f}"
\ No newline at end of file
+        return f"{self.timems():.2f}"
+
+class LatencyStats:
+    # Recent durations per key, e.g. per filter action. Only the newest max_samples of each
+    # key are kept, so percentiles follow the current behaviour and memory stays bounded.
+    def __init__(self, max_samples: int = 256):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: dict[str, collections.deque[float]] = {}
+        self._counts: dict[str, int] = {}
+
+    def add(self, key: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = collections.deque(maxlen=self.max_samples)
+                self._samples[key] = samples
+            samples.append(seconds)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def count(self, key: str) -> int:
+        return self._counts.get(key, 0)
+
+    def percentile_ms(self, key: str, percentile: float) -> float:
+        with self._lock:
+            samples = np.array(self._samples.get(key, ()))
+        if len(samples) == 0:
+            return 0.0
+        return float(np.percentile(samples, percentile)) * 1000
+
+    def summary(self, budget_ms: float | None = None) -> str:
+        with self._lock:
+            snapshot = {key: np.array(samples) * 1000 for key, samples in self._samples.items()}
+            counts = dict(self._counts)
+        if len(snapshot) == 0:
+            return "No timings recorded yet."
+        width = max(20, max(len(key) for key in snapshot))
+        lines = [f"{'(ms)':<{width}} {'calls':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}"]
+        for key, ms in sorted(snapshot.items(), key=lambda item: -np.percentile(item[1], 95)):
+            p95 = np.percentile(ms, 95)
+            flag = "  OVER BUDGET" if budget_ms is not None and p95 > budget_ms else ""
+            lines.append(f"{key:<{width}} {counts[key]:>6} {ms.mean():8.2f} {np.percentile(ms, 50):8.2f} {p95:8.2f} {ms.max():8.2f}{flag}")
+        return "\n".join(lines)
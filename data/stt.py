@@ -10,7 +10,6 @@ try:
     import string
     import pyaudio
     import time
-    import wave
     import tomllib
     import tomlkit
     import typing
@@ -22,7 +21,6 @@ try:
     import requests
     import psutil
     import uuid
-    import pyloudnorm
     from pathlib import Path
     import numpy as np
     import functools
@@ -37,8 +35,14 @@ try:
     import signal
     from enum import Enum
     import re
+    import operator
+    import itertools
+    import queue
     print("Importing dependencies...")
     import shared
+    import capture
+    import preprocessing
+    import asr_worker
     from shared import spawn_thread, report_exception
     print("Importing gui...")
     import tkinter as tk
@@ -249,13 +253,25 @@ class Configurable():
 def tk_config(obj, **kwargs):
     obj.config(**kwargs)
 
+_action_sequence = itertools.count()
+
 class ApplyableAction:
     def __init__(self, name: str, manager: "FilterManager", priority: float):
         self.manager = manager
         self.name = name
         self.priority = priority
+        # Creation order, which is the order of the filter config. Breaks priority ties, so
+        # a set of enabled actions always runs in the same order.
+        self.sequence = next(_action_sequence)
         self.enabled_by: dict[str, bool] = {}
         self.action: typing.Callable[[str], str] = ApplyableAction.DefaultAction
+        self.filter_name = ""
+        # Seconds this action may take before transform_input skips it, from filters.toml.
+        self.timeout: float | None = None
+
+    def timing_label(self) -> str:
+        # What FilterManager.timings records this action under.
+        return f"{self.filter_name}/{self.name}"
 
     @staticmethod
     def DefaultAction(input: str) -> str:
@@ -270,12 +286,6 @@ class ApplyableAction:
     def on_disable(self):
         pass
 
-    def transform(self, input: str) -> str:
-        try:
-            return self.action(input)
-        except Exception as e:
-            raise RuntimeError(f"An error occurred while transforming {input} in {self.name}: {str(e)}") from e
-
 class TransformAction(ApplyableAction):
     def __init__(self, manager: "FilterManager", priority: float, script_filename: str, enabling_args: dict[str, typing.Any]):
         super().__init__(os.path.splitext(os.path.basename(script_filename))[0] + "." + str(uuid.uuid4()), manager, priority)
@@ -294,9 +304,7 @@ class TransformAction(ApplyableAction):
             raise ImportError(f"Plugin {script_filename} does not have a process() function.")
         supports_args = "args" in inspect.signature(module.process).parameters
         if supports_args:
-            def wrapped_process(input: str) -> str:
-                return module.process(input, self.args)
-            self.action = wrapped_process
+            self.action = functools.partial(module.process, args=self.args)
         else:
             self.action = module.process
         def _set_loading_complete():
@@ -311,6 +319,9 @@ class TransformAction(ApplyableAction):
             print(f" Plugin {script_filename} does not have an on_load function.")
         else:
             self.defined_on_load = module.on_load
+        # Other plugin scripts (by filename, without .py) whose on_load has to finish first.
+        self.script_name = spec.name
+        self.load_after: list[str] = [str(name) for name in getattr(module, "LOAD_AFTER", [])]
         
     def run_defined_loader(self, state: shared.PluginLoadingState):
         if self.is_loading_complete():
@@ -323,6 +334,9 @@ class TransformAction(ApplyableAction):
         finally:
             self._set_loading_complete()
 
+    def timing_label(self) -> str:
+        return f"{self.filter_name}/{self.script_name}.py"
+
     def __repr__(self):
         return "TransformAction." + self.name
 
@@ -379,6 +393,26 @@ class SelfishAction(InceptionAction):
     def __repr__(self):
         return "SelfishAction." + self.name
 
+def _apply_rewrites(rewrites: tuple[typing.Callable[[str], str], ...], input: str) -> str:
+    for rewrite in rewrites:
+        input = rewrite(input)
+    return input
+
+class RewriteAction(ApplyableAction):
+    # A "replace" or "regex" action from the filter config. Runs without a script, and
+    # CompiledPipeline fuses neighbouring ones of the same priority into one step.
+    def __init__(self, manager: "FilterManager", priority: float, kind: str, rewrite: typing.Callable[[str], str]):
+        super().__init__(kind + "." + str(uuid.uuid4()), manager, priority)
+        self.kind = kind
+        self.rewrites = (rewrite,)
+        self.action = functools.partial(_apply_rewrites, self.rewrites)
+
+    def timing_label(self) -> str:
+        return f"{self.filter_name}/{self.kind}"
+
+    def __repr__(self):
+        return "RewriteAction." + self.name
+
 class FilterActivation:
     def __init__(self, keybind: str, suppresses: bool | None = None):
         self.keybind = keybind
@@ -394,6 +428,8 @@ class Filter:
         self.title = title
         self.manager = manager
         self.actions = actions
+        for action in actions:
+            action.filter_name = name
         self.activation_details: FilterActivation | None = activated_by
         self.enabled_by: dict[str, bool] = {}
         self.manager.register(self)
@@ -538,14 +574,142 @@ def _ecf_on_remove_hook(flow: ExpandableColumnFlow, mode: typing.Literal['before
 DISPLAYED_MODIFIERS.register_hook("on_add", _ecf_on_add_hook)
 DISPLAYED_MODIFIERS.register_hook("on_remove", _ecf_on_remove_hook)
 
+def _min_timeout(timeouts: typing.Iterable[float | None]) -> float | None:
+    known = [timeout for timeout in timeouts if timeout is not None]
+    return min(known) if len(known) > 0 else None
+
+class FilterWorker:
+    # Runs filter steps on a worker thread, so a step that runs past its deadline can be
+    # abandoned. Python can't stop the thread, so the step keeps running in the background
+    # and is skipped until it returns.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: queue.SimpleQueue | None = None
+        self.running_late: set[str] = set()
+
+    def _start(self) -> queue.SimpleQueue:
+        tasks: queue.SimpleQueue = queue.SimpleQueue()
+        def worker():
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                task()
+        spawn_thread(worker)
+        return tasks
+
+    def call(self, name: str, label: str, step: typing.Callable[[str], str], input: str, timeout: float | None, timings: shared.LatencyStats) -> str | None:
+        # The step's output, or None if it was skipped or ran out of time.
+        with self._lock:
+            if label in self.running_late:
+                print(f"Skipping filter action {label}, its last run timed out and hasn't finished yet.")
+                return None
+        if self._tasks is None:
+            self._tasks = self._start()
+        done = threading.Event()
+        result: list[typing.Any] = []
+        def task():
+            start = time.perf_counter()
+            try:
+                result.append(step(input))
+            except Exception as e:
+                result.append(e)
+            elapsed = time.perf_counter() - start
+            timings.add(label, elapsed)
+            with self._lock:
+                if label in self.running_late:
+                    self.running_late.discard(label)
+                    print(f"Filter action {label} finished after {elapsed * 1000:.0f}ms, too late to be used.")
+                done.set()
+        self._tasks.put(task)
+        if not done.wait(timeout):
+            with self._lock:
+                if not done.is_set():
+                    self.running_late.add(label)
+                    # The thread is stuck in the step. It exits once the step returns, and the
+                    # next step gets a new one.
+                    self._tasks.put(None)
+                    self._tasks = None
+                    print(f"Filter action {label} timed out after {typing.cast(float, timeout) * 1000:.0f}ms, skipping it.")
+                    return None
+        output = result[0]
+        if isinstance(output, Exception):
+            raise RuntimeError(f"An error occurred while transforming {input} in {name}: {str(output)}") from output
+        if not isinstance(output, str):
+            raise RuntimeError(f"Malformed plugin {name}: returned {type(output)} instead of str.")
+        return output
+
+class CompiledPipeline:
+    # The enabled actions' callables, highest priority first. Built once per set of enabled
+    # actions and never modified, so transform_input can run it without taking the lock.
+    def __init__(self, actions: typing.Iterable[ApplyableAction]):
+        self.actions = tuple(sorted(actions, key=lambda act: (-act.priority, act.sequence)))
+        steps: list[tuple[str, str, typing.Callable[[str], str], float | None]] = []
+        fused: list[RewriteAction] = []
+        def flush():
+            if len(fused) == 1:
+                steps.append((fused[0].name, fused[0].timing_label(), fused[0].action, fused[0].timeout))
+            elif len(fused) > 1:
+                rewrites = tuple(rewrite for action in fused for rewrite in action.rewrites)
+                steps.append(("+".join(action.name for action in fused), "+".join(action.timing_label() for action in fused), functools.partial(_apply_rewrites, rewrites), _min_timeout(action.timeout for action in fused)))
+            fused.clear()
+        for action in self.actions:
+            if isinstance(action, RewriteAction):
+                if len(fused) > 0 and fused[0].priority != action.priority:
+                    flush()
+                fused.append(action)
+                continue
+            flush()
+            steps.append((action.name, action.timing_label(), action.action, action.timeout))
+        flush()
+        self.steps = tuple(steps)
+        self.has_timeouts = any(timeout is not None for _, _, _, timeout in self.steps)
+
+    def run(self, input: str, timings: shared.LatencyStats) -> str:
+        for name, label, step, _ in self.steps:
+            start = time.perf_counter()
+            try:
+                output = step(input)
+            except Exception as e:
+                raise RuntimeError(f"An error occurred while transforming {input} in {name}: {str(e)}") from e
+            timings.add(label, time.perf_counter() - start)
+            if not isinstance(output, str):
+                raise RuntimeError(f"Malformed plugin {name}: returned {type(output)} instead of str.")
+            input = output
+        return input
+
+    def run_bounded(self, input: str, timings: shared.LatencyStats, worker: FilterWorker, pipeline_timeout: float | None) -> str:
+        # Like run(), but a step that runs out of time is skipped and its input is passed on.
+        # Once the whole pipeline is out of time, the text so far is returned as is.
+        deadline = None if pipeline_timeout is None else time.perf_counter() + pipeline_timeout
+        for index, (name, label, step, timeout) in enumerate(self.steps):
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    skipped = ", ".join(label for _, label, _, _ in self.steps[index:])
+                    print(f"Filters ran out of time ({typing.cast(float, pipeline_timeout) * 1000:.0f}ms), skipping {skipped}.")
+                    break
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            output = worker.call(name, label, step, input, timeout, timings)
+            if output is not None:
+                input = output
+        return input
+
 class FilterManager:
     def __init__(self, display: ExpandableColumnFlow):
         self.enabled_actions: dict[str, ApplyableAction] = {}
-        self.actionlist: list[ApplyableAction] = []
+        self.pipeline = CompiledPipeline(())
+        self._pipelines: dict[frozenset[str], CompiledPipeline] = {frozenset(): self.pipeline}
         self.registered_filters: dict[str, Filter] = {}
         self.enabled_filters: dict[str, Filter] = {}
         self.display = display
         self.lock = threading.RLock()
+        # Wall time of every action run, plus the ASR model's, see print_timings().
+        self.timings = shared.LatencyStats()
+        self._over_budget: set[str] = set()
+        # pipeline_timeout in filters.toml, in seconds.
+        self.pipeline_timeout: float | None = None
+        self.worker = FilterWorker()
 
     def register(self, filter: Filter):
         if filter.name in self.registered_filters:
@@ -606,20 +770,28 @@ class FilterManager:
             for action in filter.actions:
                 self.disable_action(action, source=filter)
 
+    def _update_pipeline(self):
+        transforming = [action for action in self.enabled_actions.values() if action.action is not ApplyableAction.DefaultAction]
+        key = frozenset(action.name for action in transforming)
+        pipeline = self._pipelines.get(key)
+        if pipeline is None:
+            pipeline = CompiledPipeline(transforming)
+            self._pipelines[key] = pipeline
+        # A single assignment, so a transcription running right now sees either the old
+        # pipeline or the new one.
+        self.pipeline = pipeline
+
     def _impl_enable_action(self, action: ApplyableAction):
         self.enabled_actions[action.name] = action
         if action.action is ApplyableAction.DefaultAction:
             return
-        if action not in self.actionlist:
-            self.actionlist.append(action)
-            self.actionlist.sort(key=lambda act: act.priority, reverse=True)
+        self._update_pipeline()
     
     def _impl_disable_action(self, action: ApplyableAction):
         self.enabled_actions.pop(action.name, None)
         if action.action is ApplyableAction.DefaultAction:
             return
-        if action in self.actionlist:
-            self.actionlist.remove(action)
+        self._update_pipeline()
 
     def enable_action(self, action: ApplyableAction, source: Filter):
         action.enabled_by[source.name] = True
@@ -645,11 +817,39 @@ class FilterManager:
         action.on_disable()
 
     def transform_input(self, input: str) -> str:
-        for action in self.actionlist:
-            input = action.transform(input)
-            if not isinstance(input, str):
-                raise RuntimeError(f"Malformed plugin {action.name}: returned {type(input)} instead of str.")
-        return input
+        pipeline = self.pipeline
+        start = time.perf_counter()
+        if self.pipeline_timeout is None and not pipeline.has_timeouts:
+            output = pipeline.run(input, self.timings)
+        else:
+            output = pipeline.run_bounded(input, self.timings, self.worker, self.pipeline_timeout)
+        self.timings.add(FILTERS_TOTAL_TIMING, time.perf_counter() - start)
+        self._check_budget([label for _, label, _, _ in pipeline.steps])
+        return output
+
+    def _check_budget(self, labels: list[str]):
+        if filter_latency_budget <= 0:
+            return
+        for label in labels:
+            # A percentile needs a few samples, and isn't worth recomputing every run.
+            count = self.timings.count(label)
+            if count < 20 or count % 10 != 0 or label in self._over_budget:
+                continue
+            p95 = self.timings.percentile_ms(label, 95)
+            if p95 > filter_latency_budget:
+                self._over_budget.add(label)
+                print(f"Filter action {label} is over the latency budget: p95 {p95:.1f}ms > {filter_latency_budget:.1f}ms")
+
+    def timings_summary(self) -> str:
+        return self.timings.summary(filter_latency_budget if filter_latency_budget > 0 else None)
+
+    def print_timings(self):
+        print(f"Filter timings (budget {filter_latency_budget:.1f}ms at p95):")
+        print(self.timings_summary())
+
+FILTERS_TOTAL_TIMING = "(all filters)"
+ASR_TIMING = "(asr model)"
+filter_latency_budget = 50.0
 
 audio = pyaudio.PyAudio()
 
@@ -1102,18 +1302,21 @@ def _open_settings_impl():
     output_rawtab = ttk.Frame(notebook)
     model_rawtab = ttk.Frame(notebook)
     advanced_rawtab = ttk.Frame(notebook)
+    timings_rawtab = ttk.Frame(notebook)
 
     onboarding_tab = make_tab_from_raw(onboarding_rawtab)
     input_tab = make_tab_from_raw(input_rawtab)
     output_tab = make_tab_from_raw(output_rawtab)
     model_tab = make_tab_from_raw(model_rawtab)
     advanced_tab = make_tab_from_raw(advanced_rawtab)
+    timings_tab = make_tab_from_raw(timings_rawtab)
 
     notebook.add(onboarding_rawtab, text="Onboarding")
     notebook.add(input_rawtab, text="Input")
     notebook.add(output_rawtab, text="Output")
     notebook.add(model_rawtab, text="Model")
     notebook.add(advanced_rawtab, text="Advanced")
+    notebook.add(timings_rawtab, text="Timings")
 
     def expanding_frame(tab: tk.Frame, row: int):
         tab.rowconfigure(row, weight=1)
@@ -1292,7 +1495,7 @@ def _open_settings_impl():
     model_base_frame.columnconfigure(1, weight=1)
     model_base_frame.columnconfigure(2, weight=0)
     ttk.Label(model_base_frame, text="Model  ").grid(column=0, row=0, sticky="ew")
-    combobox = ttk.Combobox(model_base_frame, values=("none", "parakeet", "granite"), textvariable=stored_vars["meta:model@string"])
+    combobox = ttk.Combobox(model_base_frame, values=("none", "parakeet", "parakeet_onnx", "granite"), textvariable=stored_vars["meta:model@string"])
     combobox.grid(column=2, row=0, sticky="ew")
     infobutton(model_base_frame, 3, 0, "The ASR model to use for speech detection. Parakeet is the fastest, but doesn't support keyworking or prompting. Granite is much slower but supports more features. Alternatively, enter the path to a python file that defines and ASRModel class.")
     ttk.Label(model_base_frame, text="Model path  ").grid(column=0, row=1, sticky="ew")
@@ -1354,6 +1557,16 @@ def _open_settings_impl():
     infobutton(advanced_base_frame, 3, 6, "The minimum length of the audio file. It will be padded to be at least this length.")
     expanding_frame(advanced_base_frame, row=7)
 
+    timings_tab.columnconfigure(0, weight=1)
+    lblwrap(ttk.Label(timings_tab, text=f"How long each filter action and the ASR model took, over their last {FILTERS.timings.max_samples} runs. Actions marked OVER BUDGET take longer than filter_latency_budget ({filter_latency_budget:.0f}ms) on 5% of runs.", font=text_font)).grid(column=0, row=0, sticky="new")
+    timings_label = ttk.Label(timings_tab, font=("Courier", 9), justify="left", anchor="nw")
+    timings_label.grid(column=0, row=2, sticky="new")
+    def refresh_timings():
+        timings_label.config(text=FILTERS.timings_summary())
+    ttk.Button(timings_tab, text="Refresh", command=refresh_timings).grid(column=0, row=1, sticky="w")
+    refresh_timings()
+    expanding_frame(timings_tab, row=3)
+
 def open_settings():
     global SETTINGS_WINDOW
     if INIT_STATE == InitState.PRESETTINGS or INIT_STATE == InitState.PREINIT:
@@ -1718,7 +1931,28 @@ FILTERS: FilterManager = FilterManager(DISPLAYED_MODIFIERS)
 say_sleep_ms = 0
 minimum_utterance_detection_length = 0
 minimum_utterance_audio_length = 0
+maximum_utterance_length = 120
 do_loudness_normalization = False
+use_warm_stream = False
+preroll_length = 0.3
+vad_trimming = False
+vad_hangover = 0.2
+streaming_transcription = False
+streaming_interval = 0.5
+streaming_pause_length = 0.3
+native_rate_capture = True
+replay_audio = ""
+warmup_passes = 1
+use_asr_worker_process = False
+parallel_plugin_loading = True
+cpu_int8_quantization = False
+replay_speed = 1.0
+resampler_quality = "fast"
+AUDIO_PIPELINE_STAGES: list[str] = []
+AUDIO_PIPELINE: preprocessing.AudioPipeline | None = None
+CAPTURE_RATE = 16000
+CAPTURE_FLOAT32 = True
+MODEL_RATE = 16000
 
 CONFIGOBJ_METADATA: dict[int, list[str]] = {}
 
@@ -1834,11 +2068,52 @@ def parse_priority(prio: str) -> float:
             raise RuntimeError(f"Priority \"{prio}\" has a secondary priority \"{split[1]}\", which isn't a number. Priorities should be priority+number")
     return base_prio + secondary_prio
 
+def _parse_rewrite_action(action: dict, typ: str, priority: float, context: str) -> RewriteAction:
+    count = 0
+    if config_has_key(action, "count"):
+        count = int(config_get_number(action, "count"))
+        if count < 0:
+            raise ConfigError(f"Expected \"count\" to be 0 or more in action {context}, was {count}")
+    replace = config_get_string(action, "replace") if config_has_key(action, "replace") else ""
+    if typ == "replace":
+        find = config_get_string(action, "find")
+        if find == "":
+            raise ConfigError(f"Expected \"find\" to not be empty for action {context}")
+        rewrite = operator.methodcaller("replace", find, replace, count if count > 0 else -1)
+    else:
+        flags = 0
+        if config_has_key(action, "ignore_case") and config_get_bool(action, "ignore_case"):
+            flags |= re.IGNORECASE
+        try:
+            pattern = re.compile(config_get_string(action, "pattern"), flags)
+            # Checks the replacement's group references now instead of on the first transcription.
+            pattern.sub(replace, "")
+        except re.error as e:
+            raise ConfigError(f"Invalid regex in action {context}: {e}")
+        rewrite = functools.partial(pattern.sub, replace, count=count)
+    return RewriteAction(FILTERS, priority, typ, rewrite)
+
+def _get_timeout(container: dict, context: str) -> float | None:
+    # "timeout" in milliseconds, returned in seconds.
+    if not config_has_key(container, "timeout"):
+        return None
+    timeout = config_get_number(container, "timeout")
+    if timeout <= 0:
+        raise ConfigError(f"Expected \"timeout\" to be more than 0 milliseconds in {context}, was {timeout}")
+    return timeout / 1000
+
 def _load_filters_from_config():
     incepted_filters: set[str] = set()
     print(f"Loading filters from config file {shared.FILTERCONFIG_FILENAME}")
     config = load_configdict_from_filename(shared.FILTERCONFIG_FILENAME, shared.FILTERCONFIG_BACKUP_FILENAME)
+    if config_has_key(config, "pipeline_timeout"):
+        pipeline_timeout = config_get_number(config, "pipeline_timeout")
+        if pipeline_timeout <= 0:
+            raise ConfigError(f"Expected \"pipeline_timeout\" to be more than 0 milliseconds, was {pipeline_timeout}")
+        FILTERS.pipeline_timeout = pipeline_timeout / 1000
     for name, filter in config.items():
+        if name == "pipeline_timeout":
+            continue
         if type(filter) is not dict:
             raise ConfigTypeError(f"Section {name} isn't a dictionary. Did you mean to write\n[{name}] ?")
         get_cfgsrc(filter).extend(get_cfgsrc(config))
@@ -1862,8 +2137,21 @@ def _load_filters_from_config():
             priority = 0
             if config_has_key(filter, "priority"):
                 priority = parse_priority(config_get_string(filter, "priority"))
-            args = _get_args_dict(filter)
-            parsed_actions.append(TransformAction(FILTERS, priority, config_get_string(filter, "action"), args))
+            if type(filter.get("action")) is dict:
+                single = config_get_dict(filter, "action")
+                typ = config_get_string(single, "type")
+                if typ != "replace" and typ != "regex":
+                    raise ConfigError(f"Expected the inline action of filter \"{name}\" to have type \"replace\" or \"regex\", was \"{typ}\"")
+                context = config_make_cfgsrc_ctx(filter, "action")
+                if config_has_key(single, "timeout") and config_has_key(filter, "timeout"):
+                    raise ConfigError(f"Attempted to set \"timeout\" both in the inline action and in filter \"{name}\". Only define one of them")
+                parsed_actions.append(_parse_rewrite_action(single, typ, priority, context))
+                parsed_actions[0].timeout = _get_timeout(single, context)
+            else:
+                args = _get_args_dict(filter)
+                parsed_actions.append(TransformAction(FILTERS, priority, config_get_string(filter, "action"), args))
+            if config_has_key(filter, "timeout"):
+                parsed_actions[0].timeout = _get_timeout(filter, f"filter \"{name}\"")
         elif has_double:
             actions = config_get_list(filter, "actions")
             for action_name in actions:
@@ -1893,8 +2181,11 @@ def _load_filters_from_config():
                 elif typ == "prompt":
                     prompt_to_set = config_get_string(action, "prompt")
                     parsed_actions.append(SetPromptAction(FILTERS, priority, prompt_to_set))
+                elif typ == "replace" or typ == "regex":
+                    parsed_actions.append(_parse_rewrite_action(action, typ, priority, config_make_cfgsrc_ctx(action, action_name)))
                 else:
-                    raise ConfigError(f"Attempted to create an action of type \"{typ}\". Expected \"script\", \"prompt\", or \"type\" for action {config_make_cfgsrc_ctx(action, action_name)}")
+                    raise ConfigError(f"Attempted to create an action of type \"{typ}\". Expected \"script\", \"prompt\", \"filter\", \"replace\", or \"regex\" for action {config_make_cfgsrc_ctx(action, action_name)}")
+                parsed_actions[-1].timeout = _get_timeout(action, config_make_cfgsrc_ctx(action, action_name))
         activation = FilterActivation("unbound", True)
         if config_has_key(filter, "bind"):
             activation.keybind = config_get_string(filter, "bind")
@@ -1924,8 +2215,8 @@ def _load_filters_from_config():
                 raise ConfigError(f"Couldn't set the action_options of {name} because scripts can only have one action_option. If you use {single_action.src} in two filters, you need to seperate it into it's own filter. You can use \"actions\" and an action with type = \"filter\" and mode = \"enable\".")
             LOADED_ACTION_OPTIONS[single_action.src] = action_options
         else:
-            if has_single:
-                src = typing.cast(TransformAction, parsed_actions[0]).src
+            if has_single and isinstance(parsed_actions[0], TransformAction):
+                src = parsed_actions[0].src
                 if LOADED_ACTION_OPTIONS.get(src) is not None:
                     raise ConfigError(f"Couldn't create the filter {name} because a second filter already defines {src}, but with \"action_options\". If you use {src} in two filters, you need to seperate it into it's own filter.")
         if group == "default" and exclusive:
@@ -1963,6 +2254,7 @@ def _fallback_prompt() -> str:
 
 path_to_model = "UNKNOWN_MODEL_PATH"
 model_keywords: list[str] = []
+model_options: dict[str, typing.Any] = {}
 model_prompt: str = _fallback_prompt()
 
 def load_settings_from_config():
@@ -1979,9 +2271,81 @@ def load_settings_from_config():
     global minimum_utterance_detection_length
     global minimum_utterance_audio_length
     global do_loudness_normalization
+    global maximum_utterance_length
     minimum_utterance_detection_length = config_get_number(meta, "minimum_utterance_detection_length") / 1000
     minimum_utterance_audio_length = config_get_number(meta, "minimum_utterance_audio_length") / 1000
+    if config_has_key(meta, "maximum_utterance_length"):
+        maximum_utterance_length = config_get_number(meta, "maximum_utterance_length") / 1000
+    if maximum_utterance_length <= 0:
+        raise ConfigError(f"Expected \"maximum_utterance_length\" in \"meta\" to be greater than zero, was {maximum_utterance_length * 1000}")
+    global use_warm_stream
+    global preroll_length
+    if config_has_key(meta, "warm_stream"):
+        use_warm_stream = config_get_bool(meta, "warm_stream")
+    if config_has_key(meta, "preroll_length"):
+        preroll_length = config_get_number(meta, "preroll_length") / 1000
+    if preroll_length < 0:
+        raise ConfigError(f"Expected \"preroll_length\" in \"meta\" to be zero or more, was {preroll_length * 1000}")
+    global vad_trimming
+    global vad_hangover
+    if config_has_key(meta, "vad_trimming"):
+        vad_trimming = config_get_bool(meta, "vad_trimming")
+    if config_has_key(meta, "vad_hangover"):
+        vad_hangover = config_get_number(meta, "vad_hangover") / 1000
+    global streaming_transcription
+    global streaming_pause_length
+    if config_has_key(meta, "streaming_transcription"):
+        streaming_transcription = config_get_bool(meta, "streaming_transcription")
+    if config_has_key(meta, "streaming_pause_length"):
+        streaming_pause_length = config_get_number(meta, "streaming_pause_length") / 1000
+    global native_rate_capture
+    global resampler_quality
+    if config_has_key(meta, "native_rate_capture"):
+        native_rate_capture = config_get_bool(meta, "native_rate_capture")
+    global use_asr_worker_process
+    if config_has_key(meta, "asr_worker_process"):
+        use_asr_worker_process = config_get_bool(meta, "asr_worker_process")
+    global cpu_int8_quantization
+    if config_has_key(meta, "cpu_int8_quantization"):
+        cpu_int8_quantization = config_get_bool(meta, "cpu_int8_quantization")
+    global filter_latency_budget
+    if config_has_key(meta, "filter_latency_budget"):
+        filter_latency_budget = config_get_number(meta, "filter_latency_budget")
+    global parallel_plugin_loading
+    if config_has_key(meta, "parallel_plugin_loading"):
+        parallel_plugin_loading = config_get_bool(meta, "parallel_plugin_loading")
+    global warmup_passes
+    if config_has_key(meta, "warmup_passes"):
+        warmup_passes = int(config_get_number(meta, "warmup_passes"))
+    global replay_audio
+    global replay_speed
+    if config_has_key(meta, "replay_audio"):
+        replay_audio = config_get_string(meta, "replay_audio")
+    if config_has_key(meta, "replay_speed"):
+        replay_speed = config_get_number(meta, "replay_speed")
+    if config_has_key(meta, "resampler_quality"):
+        resampler_quality = config_get_string(meta, "resampler_quality")
+    if resampler_quality not in preprocessing.RESAMPLER_QUALITIES:
+        raise ConfigError(f"Expected \"resampler_quality\" in \"meta\" to be one of {', '.join(preprocessing.RESAMPLER_QUALITIES.keys())}, was \"{resampler_quality}\"")
     do_loudness_normalization = config_get_bool(meta, "do_loudness_normalization")
+    global AUDIO_PIPELINE_STAGES
+    pipeline_stages: list[str] = []
+    if config_has_key(meta, "audio_pipeline"):
+        for stage in config_get_list(meta, "audio_pipeline"):
+            if type(stage) is not str:
+                raise ConfigTypeError(f"Expected audio_pipeline to be a list of strings, instead got a {type(stage).__name__}")
+            pipeline_stages.append(stage)
+    else:
+        if vad_trimming:
+            pipeline_stages.append("trim")
+        pipeline_stages.append("pad")
+        if do_loudness_normalization:
+            pipeline_stages.append("normalize")
+        pipeline_stages.append("clip")
+    for stage in pipeline_stages:
+        if stage not in preprocessing.STAGES:
+            raise ConfigError(f"Unknown stage \"{stage}\" in \"audio_pipeline\" in \"meta\". Expected one of {', '.join(preprocessing.STAGES.keys())}")
+    AUDIO_PIPELINE_STAGES = pipeline_stages
     global allow_version_checking
     allow_version_checking = config_get_bool(meta, "enable_version_checking")
     global allow_cpu_asr
@@ -1997,8 +2361,8 @@ def load_settings_from_config():
     setup_default_blocked_keys(default_blocked_keys)
     global CHOSEN_MODEL
     CHOSEN_MODEL = config_get_string(meta, "model").strip().lower()
-    if CHOSEN_MODEL != "none" and CHOSEN_MODEL != "parakeet" and CHOSEN_MODEL != "granite" and not CHOSEN_MODEL.endswith(".py"):
-        raise ConfigError(f"Expected \"model\" in \"meta\" to be either none, parakeet, granite, or a python file, instead it was \"{CHOSEN_MODEL}\"")
+    if CHOSEN_MODEL != "none" and CHOSEN_MODEL != "parakeet" and CHOSEN_MODEL != "parakeet_onnx" and CHOSEN_MODEL != "granite" and not CHOSEN_MODEL.endswith(".py"):
+        raise ConfigError(f"Expected \"model\" in \"meta\" to be either none, parakeet, parakeet_onnx, granite, or a python file, instead it was \"{CHOSEN_MODEL}\"")
     global model_prompt
     model_prompt = config_get_string(meta, "prompt")
     keywords = config_get_list(meta, "keywords")
@@ -2006,6 +2370,9 @@ def load_settings_from_config():
         if type(word) is not str:
             raise ConfigTypeError(f"Expected keywords to be a list of strings, instead got a {type(word).__name__}")
         model_keywords.append(word)
+    global model_options
+    if config_has_key(meta, "model_options"):
+        model_options = dict(config_get_dict(meta, "model_options"))
     shared.DEFAULT_WINDOW_WIDTH = int(config_get_number(meta, "window_width"))
     shared.DEFAULT_WINDOW_HEIGHT = int(config_get_number(meta, "window_height"))
     @main_thread
@@ -2089,12 +2456,13 @@ def set_INIT_STATE(state: int | InitState):
     _init_state_changed.set()
 
 state = State.READY
-STOP_RECORDING = False
 CANCEL_PROCESS = False
 RECORDING_START_TIME = time.time()
-RECORDING_STREAM: pyaudio.Stream | None
-RECORDING_FRAMES = []
+RECORDING_STREAM: capture.AudioSource | None = None
+WARM_SOURCE: capture.AudioSource | None = None
+RECORDING_BUFFER: capture.CaptureBuffer | None = None
 STATUS_LOCK = threading.Lock()
+ASR_LOCK = threading.Lock()
 TRANSCRIBED = ""
 IS_RADIO = False
 controller = pynput.keyboard.Controller()
@@ -2108,66 +2476,121 @@ def _finalize_process():
     global state
     with STATUS_LOCK:
         tk_config(label_background, bg="white")
-        global STOP_RECORDING
         global CANCEL_PROCESS
+        global RECORDING_STREAM
         state = State.READY
         if CANCEL_PROCESS:
             colorize("red", 1)
-        STOP_RECORDING = False
         CANCEL_PROCESS = False
         if not (RECORDING_STREAM is None):
-            RECORDING_STREAM.stop_stream()
-            RECORDING_STREAM.close()
+            RECORDING_STREAM.finish()
+            RECORDING_STREAM = None
         tk_config(label, text="Waiting...")
-    try:
-        os.remove("output.wav")
-    except:
-        print("Exception while removing output file.")
+
+def prepare_samples(samples: np.ndarray) -> np.ndarray:
+    if AUDIO_PIPELINE is None:
+        raise RuntimeError("Attempted to prepare samples while AUDIO_PIPELINE was None")
+    samples = AUDIO_PIPELINE.process(samples)
+    shared.verbose_print(f"Audio pipeline: {AUDIO_PIPELINE.timings()}")
+    return samples
+
+class StreamingTranscriber:
+    def __init__(self, buffer: capture.CaptureBuffer):
+        self.buffer = buffer
+        self.committed = 0
+        self.texts: list[str] = []
+        self.stop_event = threading.Event()
+        self.finished = threading.Event()
+
+    def start(self):
+        spawn_thread(self._worker)
+
+    def stop(self):
+        self.stop_event.set()
+        self.finished.wait()
+
+    def _worker(self):
+        try:
+            while not self.stop_event.wait(streaming_interval):
+                if CANCEL_PROCESS:
+                    return
+                self._commit_finished_speech()
+        finally:
+            self.finished.set()
+
+    def _commit_finished_speech(self):
+        cursor = self.buffer.cursor
+        # Committed audio is never read again, so the pipeline may work on it in place.
+        pending = self.buffer.data[self.committed:cursor]
+        minimum = int(minimum_utterance_audio_length * CAPTURE_RATE)
+        # Several pauses may have gone by if the ASR fell behind. Each finished phrase goes
+        # into one batch instead of being transcribed one after another.
+        segments: list[tuple[int, int]] = []
+        start = 0
+        for cut in preprocessing.pauses(pending, CAPTURE_RATE, streaming_pause_length):
+            if cut - start >= minimum:
+                segments.append((start, cut))
+                start = cut
+        if len(segments) == 0:
+            return
+        timer = shared.Timer()
+        if asr_model is None:
+            raise RuntimeError("Attempted to stream a transcription with a None asr_model.")
+        with ASR_LOCK:
+            texts = asr_model.transcribe_batch([prepare_samples(pending[start:end]) for start, end in segments], MODEL_RATE)
+        FILTERS.timings.add(ASR_TIMING, timer.time())
+        cut = segments[-1][1]
+        self.committed += cut
+        print(f"Streamed {cut * 1000 / CAPTURE_RATE:.0f}ms of audio in {len(segments)} segment(s) in {timer.timemstrnc()}ms")
+        for text in texts:
+            text = str(text).strip()
+            if text:
+                self.texts.append(text)
+        if state == State.RECORDING and not CANCEL_PROCESS:
+            tk_config(label, text=" ".join(self.texts) + " ...")
+
+    def tail(self) -> np.ndarray:
+        return self.buffer.view()[self.committed:]
 
 def record():
     global state
-    global STOP_RECORDING
     global RECORDING_STREAM
     if not RECORDING_STREAM:
         raise RuntimeError("Attempted to call record while RECORDING_STREAM was None")
-    while True:
-        data = RECORDING_STREAM.read(512)
-        RECORDING_FRAMES.append(data)
-        if STOP_RECORDING:
-            break
+    if RECORDING_BUFFER is None:
+        raise RuntimeError("Attempted to call record while RECORDING_BUFFER was None")
+    streamer = None
+    if streaming_transcription:
+        streamer = StreamingTranscriber(RECORDING_BUFFER)
+        streamer.start()
+    RECORDING_STREAM.wait()
+    if streamer is not None:
+        streamer.stop()
+    if RECORDING_BUFFER.truncated:
+        print(f"Utterance reached maximum_utterance_length ({maximum_utterance_length:.1f}s), stopping the recording.")
     if (time.time() - RECORDING_START_TIME < minimum_utterance_detection_length) or CANCEL_PROCESS:
         _finalize_process()
         return
     with STATUS_LOCK:
-        RECORDING_STREAM.stop_stream()
-        RECORDING_STREAM.close()
+        RECORDING_STREAM.finish()
         RECORDING_STREAM = None
-        samples = np.frombuffer(b''.join(RECORDING_FRAMES), dtype=np.int16).astype(np.float32) / 32768.0
-                         # SECONDS
-        min_samples = int(minimum_utterance_audio_length * 16000)
-        if len(samples) < min_samples:
-            padding = np.zeros(min_samples - len(samples), dtype=np.float32)
-            samples = np.concatenate([samples, padding])
-        if do_loudness_normalization:
-            meter = pyloudnorm.Meter(16000)
-            loudness = meter.integrated_loudness(samples)
-            target_lufs = -18.0
-            samples = pyloudnorm.normalize.loudness(samples, loudness, target_lufs)
-        samples = np.clip(samples, -1.0, 1.0)
-        samples_int16 = (samples * 32767).astype(np.int16)
-        file = wave.open("output.wav", "wb")
-        file.setnchannels(1)
-        file.setsampwidth(audio.get_sample_size(pyaudio.paInt16))
-        file.setframerate(16000)
-        file.writeframes(samples_int16.tobytes())
-        file.close()
-        STOP_RECORDING = False
+        # The buffer isn't touched again until the next begin_recording().
+        if streamer is not None:
+            samples = streamer.tail()
+        else:
+            samples = RECORDING_BUFFER.view()
         state = State.PROCESSING
     global TRANSCRIBED
     tk_config(label, text="Transcribing...")
     if asr_model is None:
         raise RuntimeError("Attempted to call transcribe on a None asr_model.")
-    TRANSCRIBED = str(asr_model.transcribe("output.wav"))
+    texts = [] if streamer is None else streamer.texts
+    if streamer is None or streamer.committed == 0 or len(samples) >= int(minimum_utterance_detection_length * CAPTURE_RATE):
+        asr_timer = shared.Timer()
+        with ASR_LOCK:
+            texts.append(str(asr_model.transcribe_array(prepare_samples(samples), MODEL_RATE)).strip())
+        FILTERS.timings.add(ASR_TIMING, asr_timer.time())
+    TRANSCRIBED = " ".join(text for text in texts if text)
     if hwnd_speech_indicator:
         hwnd_settext("")
     if CANCEL_PROCESS:
@@ -2185,8 +2608,6 @@ def begin_recording():
     global state
     global STATUS_LOCK
     global RECORDING_STREAM
-    global RECORDING_FRAMES
-    global STOP_RECORDING
     global RECORDING_START_TIME
     global IS_RADIO
     if state != State.READY:
@@ -2197,19 +2618,90 @@ def begin_recording():
     with STATUS_LOCK:
         IS_RADIO = False
         RECORDING_START_TIME = time.time()
-        STOP_RECORDING = False
         state = State.RECORDING
-        RECORDING_STREAM = audio.open(format=pyaudio.paInt16, rate=16000, channels=1, input=True, frames_per_buffer=512)
-        RECORDING_FRAMES = []
+        if RECORDING_BUFFER is None:
+            raise RuntimeError("Attempted to begin recording while RECORDING_BUFFER was None")
+        RECORDING_BUFFER.reset()
+        if WARM_SOURCE is not None:
+            WARM_SOURCE.begin(RECORDING_BUFFER)
+            RECORDING_STREAM = WARM_SOURCE
+        else:
+            RECORDING_STREAM = capture.MicrophoneCapture(audio, rate=CAPTURE_RATE, frames_per_buffer=capture_frames_per_buffer(), buffer=RECORDING_BUFFER, float32=CAPTURE_FLOAT32)
     spawn_thread(record)
 
+def capture_frames_per_buffer() -> int:
+    # About 32ms per callback, whatever the device rate.
+    return max(256, int(CAPTURE_RATE * 0.032))
+
+def native_input_rate() -> int | None:
+    try:
+        return int(audio.get_default_input_device_info()["defaultSampleRate"])
+    except (IOError, KeyError, ValueError) as e:
+        print(f"Couldn't query the default input device's sample rate: ({type(e).__name__}) {e}")
+        return None
+
+def setup_audio():
+    # Needs the loaded model to know which rate to resample to.
+    global CAPTURE_RATE
+    global CAPTURE_FLOAT32
+    global MODEL_RATE
+    global AUDIO_PIPELINE
+    global RECORDING_BUFFER
+    if asr_model is None:
+        raise RuntimeError("Attempted to set up audio with a None asr_model.")
+    MODEL_RATE = asr_model.sample_rate
+    CAPTURE_RATE = MODEL_RATE
+    if native_rate_capture and not replay_audio:
+        CAPTURE_RATE = native_input_rate() or MODEL_RATE
+    stages = list(AUDIO_PIPELINE_STAGES)
+    if CAPTURE_RATE != MODEL_RATE and "resample" not in stages:
+        stages.insert(0, "resample")
+    CAPTURE_FLOAT32 = True if replay_audio else capture.supports_float32(audio, CAPTURE_RATE)
+    print(f"Capturing {'float32' if CAPTURE_FLOAT32 else 'int16'} audio at {CAPTURE_RATE}Hz, model expects {MODEL_RATE}Hz.")
+    AUDIO_PIPELINE = preprocessing.AudioPipeline.build(stages, CAPTURE_RATE, {
+        "model_rate": MODEL_RATE,
+        "resampler_quality": resampler_quality,
+        "vad_hangover": vad_hangover,
+        "minimum_length": minimum_utterance_audio_length,
+    })
+    RECORDING_BUFFER = capture.CaptureBuffer(
+        max_samples=int(maximum_utterance_length * CAPTURE_RATE),
+        initial_samples=int(min(maximum_utterance_length, 30) * CAPTURE_RATE),
+        dtype=np.float32
+        )
+    if replay_audio:
+        open_replay_source()
+    else:
+        open_warm_microphone()
+
+def open_replay_source():
+    # Stands in for the microphone. Each recording plays the next file and stops at its end.
+    global WARM_SOURCE
+    try:
+        files = capture.replay_files(replay_audio)
+    except RuntimeError as e:
+        raise ConfigError(f"Couldn't use \"replay_audio\" in \"meta\": {e}") from e
+    WARM_SOURCE = capture.ReplaySource(files, CAPTURE_RATE, capture_frames_per_buffer(), speed=replay_speed)
+    print(f"Replaying {len(files)} audio file(s) from {replay_audio} at {replay_speed}x instead of using the microphone.")
+
+def open_warm_microphone():
+    global WARM_SOURCE
+    if not use_warm_stream:
+        return
+    try:
+        WARM_SOURCE = capture.MicrophoneCapture(audio, rate=CAPTURE_RATE, frames_per_buffer=capture_frames_per_buffer(), warm=True, preroll_samples=int(preroll_length * CAPTURE_RATE), float32=CAPTURE_FLOAT32)
+        print(f"Opened warm microphone stream with {preroll_length * 1000:.0f}ms of pre-roll.")
+    except Exception as e:
+        WARM_SOURCE = None
+        print(f"Couldn't open the warm microphone stream, falling back to opening it per recording: ({type(e).__name__}) {e}")
+
 def end_recording():
     if state != State.RECORDING:
         return
     global STATUS_LOCK
-    global STOP_RECORDING
     with STATUS_LOCK:
-        STOP_RECORDING = True
+        if RECORDING_STREAM is not None:
+            RECORDING_STREAM.request_stop()
 
 @main_thread
 def colorize(val: str, time: float):
@@ -2727,6 +3219,8 @@ def submit():
     with STATUS_LOCK:
         transcript = TRANSCRIBED
     transcript = FILTERS.transform_input(transcript)
+    if shared.VERBOSE:
+        FILTERS.print_timings()
     _finalize_process()
     tk_config(label, text=transcript)
     print("--- Submitting transcript")
@@ -2771,14 +3265,14 @@ def reject():
     global state
     if state == State.READY:
         return
-    global STOP_RECORDING
     global CANCEL_PROCESS
     if use_hwnd:
         hwnd_settext("")
     if state == State.RECORDING:
         with STATUS_LOCK:
-            STOP_RECORDING = True
             CANCEL_PROCESS = True
+            if RECORDING_STREAM is not None:
+                RECORDING_STREAM.request_stop()
     elif state == State.ACCEPTING:
         _finalize_process()
         colorize("red", 1)
@@ -3012,6 +3506,110 @@ def _load_model_get_hwnd():
                     break
                 _set_model_loadingtext("Using default chat box...")
 
+class LoadingStatus:
+    # Loading text with one line per loader, so plugins loading alongside the ASR model
+    # don't overwrite each other's progress.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lines: dict[str, str] = {}
+
+    def _update(self):
+        _set_model_loadingtext("\n".join(self._lines.values()))
+
+    def setter(self, key: str, prefix: str = "") -> typing.Callable[[str], None]:
+        def settext(text: str):
+            with self._lock:
+                self._lines[key] = prefix + text
+                self._update()
+        return settext
+
+    def remove(self, key: str):
+        with self._lock:
+            self._lines.pop(key, None)
+            self._update()
+
+class PluginLoad:
+    def __init__(self, filter: Filter, action: TransformAction):
+        self.filter = filter
+        self.action = action
+        self.dependencies: list["PluginLoad"] = []
+        self.done = threading.Event()
+        self.error: BaseException | None = None
+
+    def run(self, state: shared.PluginLoadingState):
+        try:
+            state.settext("Loading...")
+            self.action.run_defined_loader(state)
+        except Exception as e:
+            raise RuntimeError(f"Exception encountered while loading {self.filter.name}: ({type(e).__name__}): {e}")
+
+def pending_plugin_loads() -> list[PluginLoad]:
+    # Every plugin on_load still to run, ordered so that LOAD_AFTER dependencies come first.
+    loads: list[PluginLoad] = []
+    for _, filter in FILTERS.registered_filters.items():
+        if filter in FILTER_SKIP_LOAD_FOR:
+            print(f"Skipping loading of {filter}")
+            continue
+        for action in filter.actions:
+            if not isinstance(action, TransformAction):
+                continue
+            if action.is_loading_complete():
+                print(f"Skipping duplicate load for action {action} in {filter.name}")
+                continue
+            loads.append(PluginLoad(filter, action))
+    by_script: dict[str, list[PluginLoad]] = {}
+    previous_by_src: dict[str, PluginLoad] = {}
+    for load in loads:
+        by_script.setdefault(load.action.script_name, []).append(load)
+        # Loads of the same script run one after another, so that e.g. a model download in
+        # on_load only happens once and the next load finds it already there.
+        previous = previous_by_src.get(load.action.src)
+        if previous is not None:
+            load.dependencies.append(previous)
+        previous_by_src[load.action.src] = load
+    ordered: list[PluginLoad] = []
+    visiting: set[PluginLoad] = set()
+    def visit(load: PluginLoad, chain: list[str]):
+        if load in ordered:
+            return
+        if load in visiting:
+            raise RuntimeError(f"Plugins have a LOAD_AFTER cycle: {' -> '.join(chain)}")
+        visiting.add(load)
+        for dependency in list(load.dependencies):
+            visit(dependency, chain + [dependency.action.script_name])
+        for name in load.action.load_after:
+            if name not in by_script:
+                print(f"Plugin {load.action.script_name} loads after {name}, which isn't loaded.")
+            for dependency in by_script.get(name, []):
+                if dependency.action.script_name == load.action.script_name:
+                    continue
+                load.dependencies.append(dependency)
+                visit(dependency, chain + [name])
+        visiting.remove(load)
+        ordered.append(load)
+    for load in loads:
+        visit(load, [load.action.script_name])
+    return ordered
+
+def start_plugin_loads(loads: list[PluginLoad], make_state: typing.Callable[[PluginLoad, typing.Callable[[str], typing.Any]], shared.PluginLoadingState], status: LoadingStatus):
+    # One thread per on_load. Each waits for its LOAD_AFTER dependencies and for earlier
+    # loads of the same script, then loads.
+    for load in loads:
+        def worker(load: PluginLoad = load):
+            key = f"plugin:{load.action.name}"
+            try:
+                for dependency in load.dependencies:
+                    dependency.done.wait()
+                    if dependency.error is not None:
+                        raise RuntimeError(f"Couldn't load {load.filter.name}, it loads after {dependency.filter.name}, which failed.")
+                load.run(make_state(load, status.setter(key, f"Plugin \"{load.filter.name}\": ")))
+            except BaseException as e:
+                load.error = e
+            finally:
+                status.remove(key)
+                load.done.set()
+        spawn_thread(worker)
+
 def load_model(finished: threading.Event, should_spin: Box[bool]):
     global asr_model
     def cancel_init(reason: str):
@@ -3023,9 +3621,22 @@ def load_model(finished: threading.Event, should_spin: Box[bool]):
     def hide_spinner():
         should_spin.value = False
         _model_loadingtext_changed.set()
+    def make_plugin_state(load: PluginLoad, settext: typing.Callable[[str], typing.Any]) -> shared.PluginLoadingState:
+        return shared.PluginLoadingState(
+            window=root,
+            settext=settext,
+            quit=quit,
+            cancel_init=cancel_init,
+            show_spinner=show_spinner,
+            hide_spinner=hide_spinner,
+            filter_name = load.filter.name,
+            action_options=LOADED_ACTION_OPTIONS.get(load.action.src)
+            )
+    status = LoadingStatus()
+    settext = status.setter("model") if parallel_plugin_loading else _set_model_loadingtext
     model_loading_state = shared.ModelLoadingState(
         window=root,
-        settext=_set_model_loadingtext,
+        settext=settext,
         quit=quit,
         cancel_init=cancel_init,
         show_spinner=show_spinner,
@@ -3033,73 +3644,51 @@ def load_model(finished: threading.Event, should_spin: Box[bool]):
         model_dir=path_to_model,
         prompt=model_prompt,
         model_keywords=model_keywords,
-        allow_cpu=allow_cpu_asr
+        allow_cpu=allow_cpu_asr,
+        model_options=model_options,
+        cpu_int8=cpu_int8_quantization
         )
+    plugin_loads = pending_plugin_loads()
+    if parallel_plugin_loading:
+        # Plugins load while the ASR model does, instead of after it.
+        start_plugin_loads(plugin_loads, make_plugin_state, status)
     try:
         if CHOSEN_MODEL is None:
             raise RuntimeError("CHOSEN_MODEL was None, expected string.")
-        if CHOSEN_MODEL == "none":
-            from models.fake_asr_model import FakeASRModel
-            print("Loading FakeASRModel...")
-            asr_model = FakeASRModel(model_loading_state)
-            print("Loaded FakeASRModel.")
-        elif CHOSEN_MODEL == "parakeet":
-            from models.parakeetv2 import ParakeetV2
-            print("Loading ParakeetV2...")
-            asr_model = ParakeetV2(model_loading_state)
-            print("Loaded ParakeetV2.")
-        elif CHOSEN_MODEL == "granite":
-            from models.granite_speech import GraniteSpeech4p1x2B
-            print("Loading GraniteSpeech4p1x2B...")
-            asr_model = GraniteSpeech4p1x2B(model_loading_state)
-            print("Loaded GraniteSpeech4p1x2B.")
+        if use_asr_worker_process:
+            asr_model = asr_worker.ASRWorkerProcess(CHOSEN_MODEL, model_loading_state)
         else:
-            spec = importlib.util.spec_from_file_location(CHOSEN_MODEL)
-            if spec is None:
-                raise ImportError(f"Couldn't load ASR model {CHOSEN_MODEL} (spec was None)")
-            if spec.loader is None:
-                raise ImportError(f"Couldn't load ASR model {CHOSEN_MODEL} (spec {spec} had None loader)")
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            if not hasattr(module, "ASRModel"):
-                raise ImportError(f"While loading a user-defined ASR model, couldn't find the class \"ASRModel\". Did you name your class something else? Ensure that your model is named \"ASRModel\" exactly. ({CHOSEN_MODEL} does not have an ASRModel attribute.)")
-            asr_model = module.ASRModel(model_loading_state)
+            asr_model = shared.load_asr_model(CHOSEN_MODEL, model_loading_state)
     except shared.ModelInitCancelledError:
         print("Model init cancelled.")
         return
     print("Finished ASR loading.")
+    setup_audio()
+    model_loading_state.checkpoints.checkpoint("setting up audio")
+    if warmup_passes > 0:
+        settext("Warming up the model...")
+        with ASR_LOCK:
+            shared.warm_up_model(asr_model, prepare_samples, CAPTURE_RATE, warmup_passes, model_loading_state.checkpoints)
     model_loading_state.checkpoints.end()
     model_loading_state.checkpoints.print()
     show_spinner()
     set_INIT_STATE(InitState.PREFILTERLOADING)
-    _set_model_loadingtext(f"Loading plugins...")
-    for _, filter in FILTERS.registered_filters.items():
-        if filter in FILTER_SKIP_LOAD_FOR:
-            print(f"Skipping loading of {filter}")
-            continue
-        for action in filter.actions:
-            if not isinstance(action, TransformAction):
-                continue
-            if action.is_loading_complete():
-                print(f"Skipping duplicate load for action {action} in {filter.name}")
-                continue
-            def settext(text: str):
-                _set_model_loadingtext(f"Loading plugin \"{filter.name}\":\n{text}")
-            state = shared.PluginLoadingState(
-                window=root,
-                settext=settext,
-                quit=quit,
-                cancel_init=cancel_init,
-                show_spinner=show_spinner,
-                hide_spinner=hide_spinner,
-                filter_name = filter.name,
-                action_options=LOADED_ACTION_OPTIONS.get(action.src)
-                )
-            try:
-                settext("Loading...")
-                action.run_defined_loader(state)
-            except Exception as e:
-                raise RuntimeError(f"Exception encountered while loading {filter.name}: ({type(e).__name__}): {e}")
+    if parallel_plugin_loading:
+        status.setter("model")("Loading plugins...")
+        plugin_timer = shared.Timer()
+        for load in plugin_loads:
+            load.done.wait()
+        status.remove("model")
+        print(f"Waited {plugin_timer.resetmstrnc()}ms for plugins after the ASR model loaded.")
+        for load in plugin_loads:
+            if load.error is not None:
+                raise load.error
+    else:
+        _set_model_loadingtext(f"Loading plugins...")
+        for load in plugin_loads:
+            def plugin_settext(text: str, load: PluginLoad = load):
+                _set_model_loadingtext(f"Loading plugin \"{load.filter.name}\":\n{text}")
+            load.run(make_plugin_state(load, plugin_settext))
     show_spinner()
     _load_model_get_hwnd()
     finished.set()
@@ -3267,6 +3856,7 @@ try:
 except Exception as e:
     print(f"encountered an exception on mainloop: {e}")
 print("--- MAINLOOP TERMINATED")
+FILTERS.print_timings()
 for tracked_toplevel in shared._tracked_toplevels:
     tracked_toplevel.destroy()
 if FINAL_FATAL_MESSAGE is not None:
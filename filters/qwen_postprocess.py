@@ -1,8 +1,17 @@
 import shared
 import os
 import typing
+import copy
+import threading
+from collections import OrderedDict
 MODEL = None
 TOKENIZER = None
+# (invoker, prompt) -> (token ids of the templated system prompt, their past_key_values).
+# Every call with the same prompt starts with the same tokens, so only the transcript after
+# them needs a forward pass.
+PREFIX_CACHE: OrderedDict[tuple[str, str], tuple[list[int], typing.Any]] = OrderedDict()
+PREFIX_CACHE_SIZE = 4
+PREFIX_CACHE_LOCK = threading.Lock()
 
 def on_load(state: shared.PluginLoadingState):
     state.settext("Loading transformers.AutoTokenizer and AutoModelForCausalLM")
@@ -45,30 +54,21 @@ def process(input: str, args: dict[str, typing.Any]) -> str:
         raise RuntimeError("Enabled qwen_postprocess without providing a prompt.")
     if not isinstance(prompt, str):
         raise RuntimeError("Enabled qwen_postprocess and provided a prompt that wasn't a string.")
-    messages = [
-        {
-            "role": "system",
-            "content": prompt,
-        },
-        {
-            "role": "user",
-            "content": f"Transcript: {input}",
-        },
-    ]
-
-    text = TOKENIZER.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-    )
-
+    text = _templated(prompt, input)
     inputs = TOKENIZER(
         text,
         return_tensors="pt",
     ).to(MODEL.device)
-    
+    prefix_ids, prefix_cache = _prefix_cache(str(args.get("invoker")), prompt)
+    input_ids = inputs.input_ids[0].tolist()
+    past_key_values = None
+    if len(prefix_ids) > 0 and len(prefix_ids) < len(input_ids) and input_ids[:len(prefix_ids)] == prefix_ids:
+        # generate() extends the cache it's given, so each call gets its own copy.
+        past_key_values = copy.deepcopy(prefix_cache)
+
     output = MODEL.generate(
         **inputs,
+        past_key_values=past_key_values,
         max_new_tokens=max(8, len(input.split()) * 3),
         do_sample=False,
         temperature=None,
@@ -78,4 +78,55 @@ def process(input: str, args: dict[str, typing.Any]) -> str:
         output[0][inputs.input_ids.shape[1]:],
         skip_special_tokens=True,
     )
-    return result.strip()
\ No newline at end of file
+    return result.strip()
+
+def _templated(prompt: str, input: str) -> str:
+    if TOKENIZER is None:
+        raise RuntimeError("Attempted to template a prompt while TOKENIZER was None.")
+    messages = [
+        {
+            "role": "system",
+            "content": prompt,
+        },
+        {
+            "role": "user",
+            "content": f"Transcript: {input}",
+        },
+    ]
+    return TOKENIZER.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True,
+    )
+
+def _prefix_cache(invoker: str, prompt: str) -> tuple[list[int], typing.Any]:
+    if TOKENIZER is None or MODEL is None:
+        raise RuntimeError("Attempted to build a prefix cache while MODEL or TOKENIZER was None.")
+    key = (invoker, prompt)
+    with PREFIX_CACHE_LOCK:
+        cached = PREFIX_CACHE.get(key)
+        if cached is not None:
+            PREFIX_CACHE.move_to_end(key)
+            return cached
+    import torch
+    # The tokens shared by two different transcripts are the ones that only depend on the
+    # prompt. The last one is left out, since it can merge with the start of the transcript.
+    first = TOKENIZER(_templated(prompt, "a"))["input_ids"]
+    second = TOKENIZER(_templated(prompt, "b"))["input_ids"]
+    shared_length = 0
+    while shared_length < min(len(first), len(second)) and first[shared_length] == second[shared_length]:
+        shared_length += 1
+    prefix_ids = list(first[:max(0, shared_length - 1)])
+    prefix_cache = None
+    if len(prefix_ids) > 0:
+        with torch.no_grad():
+            prefix_cache = MODEL(
+                input_ids=torch.tensor([prefix_ids], device=MODEL.device),
+                use_cache=True,
+            ).past_key_values
+    with PREFIX_CACHE_LOCK:
+        PREFIX_CACHE[key] = (prefix_ids, prefix_cache)
+        PREFIX_CACHE.move_to_end(key)
+        while len(PREFIX_CACHE) > PREFIX_CACHE_SIZE:
+            PREFIX_CACHE.popitem(last=False)
+    return prefix_ids, prefix_cache
@@ -41,6 +41,10 @@ files_to_package: list[Packageable] = [
     Packageable.file("setup.bat"),
     Packageable.file("data/stt.py"),
     Packageable.file("data/shared.py"),
+    Packageable.file("data/capture.py"),
+    Packageable.file("data/preprocessing.py"),
+    Packageable.file("data/benchmark.py"),
+    Packageable.file("data/asr_worker.py"),
     Packageable.file("data/installer.py"),
     Packageable.file("data/changelog.txt"),
     Packageable.directory("runtime"),